@@ -0,0 +1,88 @@
+import importlib
+from typing import AsyncIterator, Dict, List, Optional, Type
+
+ENTRY_POINT_GROUP = "of_translate.backends"
+
+_registry = {}
+
+
+class Backend:
+    # A translation backend. translate, translate_batch and translate_stream
+    # may be plain functions (run on the default executor) or coroutines.
+    # The flags below are what the scheduler routes on; a backend is enabled
+    # by a top-level config section named after it, which is passed in as cfg.
+
+    name = ""
+    timeout = 5
+    concurrency = 4  # calls in flight at once
+    batch = False  # implements translate_batch
+    batch_size = 16
+    batch_wait_ms = 50
+    stream = False  # implements translate_stream
+    languages = None  # target language codes it can produce, None = any
+    misses = False  # an empty answer means "not covered", not a failure
+
+    def __init__(self, cfg: dict):
+        self.cfg = cfg
+        self.timeout = cfg.get("timeout", self.timeout)
+        self.concurrency = max(1, cfg.get("concurrency", self.concurrency))
+        batch_cfg = cfg.get("batch") or {}
+        self.batch_size = max(1, int(batch_cfg.get("max_size", self.batch_size)))
+        self.batch_wait_ms = batch_cfg.get("max_wait_ms", self.batch_wait_ms)
+
+    def supports(self, lang: str) -> bool:
+        return self.languages is None or lang.lower().split("-")[0] in self.languages
+
+    def translate(self, text: str, target: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def translate_batch(self, texts: List[str], target: str) -> Optional[List[Optional[str]]]:
+        # None for the whole batch makes the caller retry each text singly
+        raise NotImplementedError
+
+    def translate_stream(self, text: str, target: str) -> AsyncIterator[str]:
+        # async iterator of the translation so far, growing with each item
+        raise NotImplementedError
+
+    async def aclose(self):
+        pass
+
+
+def register(name: str, cls: Optional[Type[Backend]] = None):
+    def add(cls):
+        cls.name = name
+        _registry[name] = cls
+        return cls
+
+    return add if cls is None else add(cls)
+
+
+def registered() -> Dict[str, Type[Backend]]:
+    return dict(_registry)
+
+
+def load_modules(names: List[str]):
+    # modules listed in config register their backends when imported
+    for name in names:
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            print(f"backend module {name} not loaded: {e}")
+
+
+def load_entry_points():
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        return
+    try:
+        eps = entry_points(group=ENTRY_POINT_GROUP)
+    except TypeError:
+        eps = entry_points().get(ENTRY_POINT_GROUP, [])
+    for ep in eps:
+        if ep.name in _registry:
+            continue
+        try:
+            register(ep.name, ep.load())
+        except Exception as e:
+            print(f"backend {ep.name} not loaded: {e}")
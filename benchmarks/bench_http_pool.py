@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+import httpx
+from googletrans import Translator
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import translate
+
+
+async def _google_fresh(text, dest):
+    async with Translator() as translator:
+        return await translator.translate(text, dest=dest)
+
+
+def _timed(fn, n):
+    samples = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        try:
+            fn()
+        except httpx.HTTPError as e:
+            print("request failed:", e)
+        samples.append((time.perf_counter() - t0) * 1000.0)
+    return samples
+
+
+def _report(label, samples):
+    samples = sorted(samples)
+    p90 = samples[int(len(samples) * 0.9) - 1] if len(samples) >= 10 else samples[-1]
+    print(
+        f"{label:<12} mean {statistics.mean(samples):8.1f} ms  "
+        f"median {statistics.median(samples):8.1f} ms  p90 {p90:8.1f} ms"
+    )
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Per-request latency with a fresh connection per call vs the pooled clients used by translate.py"
+    )
+    parser.add_argument("url", nargs="?", default="https://api.openai.com/v1/models")
+    parser.add_argument("-n", type=int, default=20)
+    parser.add_argument("--google", action="store_true", help="also time googletrans")
+    args = parser.parse_args()
+
+    translate.configure({"google": {"enable": True}, "cache": {"enable": False}})
+    engine = translate._engine
+
+    fresh = _report("fresh", _timed(lambda: httpx.get(args.url, timeout=10), args.n))
+
+    async def pooled_get():
+        return await engine.client("bench").get(args.url, timeout=10)
+
+    engine.submit(pooled_get()).result()
+    pooled = _report(
+        "pooled", _timed(lambda: engine.submit(pooled_get()).result(), args.n)
+    )
+    print(f"saved per request (median): {fresh - pooled:.1f} ms")
+
+    if args.google:
+        old = _report(
+            "google old",
+            _timed(lambda: asyncio.run(_google_fresh("hello", "de")), args.n),
+        )
+        translate.translate_text("hello")
+        new = _report(
+            "google kept",
+            _timed(
+                lambda: engine.submit(engine.google("hello", "de")).result(), args.n
+            ),
+        )
+        print(f"google saved per request (median): {old - new:.1f} ms")
+    translate.close()
+
+
+if __name__ == "__main__":
+    main()
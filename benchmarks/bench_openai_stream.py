@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import translate
+
+# A local stand-in for the chat-completions endpoint. It "translates" by
+# echoing the text back word by word, after first_token seconds and then one
+# word every token seconds, as server-sent events when the request asks for
+# "stream": true and as a single JSON body otherwise.
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    first_token = 0.3
+    token = 0.04
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        text = body["messages"][-1]["content"].rsplit("\n\n", 1)[-1]
+        words = text.split(" ")
+        tokens = [w if i == 0 else " " + w for i, w in enumerate(words)]
+        time.sleep(self.first_token)
+        if body.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            for i, tok in enumerate(tokens):
+                if i:
+                    time.sleep(self.token)
+                chunk = {"choices": [{"index": 0, "delta": {"content": tok}}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+            return
+        time.sleep(self.token * (len(tokens) - 1))
+        out = json.dumps({"choices": [{"message": {"content": "".join(tokens)}}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+    def log_message(self, *args):
+        pass
+
+
+def _run(url, stream, n, words):
+    translate.configure(
+        {
+            "openai": {"enable": True, "api_url": url, "api_key": "mock", "stream": stream},
+            "cache": {"enable": False},
+            "detect": {"enable": False},
+        }
+    )
+    first, total = [], []
+    for i in range(n):
+        text = " ".join(f"w{i}x{j}" for j in range(words))
+        seen = []
+        t0 = time.perf_counter()
+        future = translate.submit(
+            text, lambda s: seen or seen.append(time.perf_counter() - t0)
+        )
+        future.result()
+        elapsed = time.perf_counter() - t0
+        total.append(elapsed * 1000.0)
+        first.append((seen[0] if seen else elapsed) * 1000.0)
+    translate.close()
+    label = "stream" if stream else "complete"
+    print(
+        f"{label:<10} first glyph median {statistics.median(first):8.1f} ms  "
+        f"finished median {statistics.median(total):8.1f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time to first glyph and to the finished line, streamed vs complete OpenAI responses, against a local mock SSE server"
+    )
+    parser.add_argument("-n", type=int, default=10)
+    parser.add_argument("--words", type=int, default=40, help="words per message")
+    parser.add_argument("--first-token-ms", type=float, default=300)
+    parser.add_argument("--token-ms", type=float, default=40)
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="only run the mock server, e.g. to point config.yaml's openai.api_url at it",
+    )
+    args = parser.parse_args()
+
+    MockHandler.first_token = args.first_token_ms / 1000.0
+    MockHandler.token = args.token_ms / 1000.0
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), MockHandler)
+    server.daemon_threads = True
+    url = f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions"
+    if args.serve:
+        print(f"mock chat completions on {url}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    _run(url, False, args.n, args.words)
+    _run(url, True, args.n, args.words)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
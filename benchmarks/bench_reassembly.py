@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import random
+import struct
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from flow import FlowBuffer
+
+# Frames mimic the game's layout: u16 header length, a header that carries
+# the body length, then the body. The header is a fixed 4-byte big-endian
+# body length so the benchmark only measures buffer handling.
+
+
+def make_stream(frames, body_min, body_max, seed=1):
+    rnd = random.Random(seed)
+    out = bytearray()
+    for _ in range(frames):
+        body = rnd.randbytes(rnd.randint(body_min, body_max))
+        out += struct.pack(">HI", 4, len(body)) + body
+    return bytes(out)
+
+
+def segments(stream, mss):
+    return [stream[i : i + mss] for i in range(0, len(stream), mss)]
+
+
+def old_reassembly(segs):
+    buf = bytearray()
+    frames = 0
+    checksum = 0
+    for seg in segs:
+        buf.extend(bytes(seg))
+        while len(buf) >= 2:
+            header_len = struct.unpack(">H", buf[0:2])[0]
+            if len(buf) < 2 + header_len:
+                break
+            header = bytes(buf[2 : 2 + header_len])
+            body_len = struct.unpack(">I", header)[0]
+            total = 2 + header_len + body_len
+            if len(buf) < total:
+                break
+            body = bytes(buf[2 + header_len : total])
+            del buf[:total]
+            frames += 1
+            checksum += len(body)
+    return frames, checksum
+
+
+def new_reassembly(segs):
+    fb = FlowBuffer()
+    frames = 0
+    checksum = 0
+    for seg in segs:
+        fb.extend(seg)
+        mv = fb.view()
+        end = len(mv)
+        pos = 0
+        while end - pos >= 2:
+            header_len = (mv[pos] << 8) | mv[pos + 1]
+            if end - pos < 2 + header_len:
+                break
+            body_len = struct.unpack_from(">I", mv, pos + 2)[0]
+            total = 2 + header_len + body_len
+            if end - pos < total:
+                break
+            body = mv[pos + 2 + header_len : pos + total]
+            pos += total
+            frames += 1
+            checksum += len(body)
+        body = None
+        mv.release()
+        fb.consume(pos)
+    return frames, checksum
+
+
+def bench(fn, segs, repeat):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn(segs)
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare bytearray del-prefix reassembly with FlowBuffer + memoryview"
+    )
+    parser.add_argument("--frames", type=int, default=20000)
+    parser.add_argument("--body-min", type=int, default=8)
+    parser.add_argument("--body-max", type=int, default=64)
+    parser.add_argument(
+        "--segment",
+        type=int,
+        default=65536,
+        help="bytes per captured segment; large values model bursty coalesced reads",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    stream = make_stream(args.frames, args.body_min, args.body_max)
+    segs = segments(stream, args.segment)
+    t_old, r_old = bench(old_reassembly, segs, args.repeat)
+    t_new, r_new = bench(new_reassembly, segs, args.repeat)
+    assert r_old == r_new, (r_old, r_new)
+    print(f"{len(stream)} bytes, {args.frames} frames, {len(segs)} segments")
+    print(f"old  {t_old * 1000:8.1f} ms  {args.frames / t_old:12.0f} frames/s")
+    print(f"new  {t_new * 1000:8.1f} ms  {args.frames / t_new:12.0f} frames/s")
+    print(f"speedup x{t_old / t_new:.2f}")
+
+
+if __name__ == "__main__":
+    main()
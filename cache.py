@@ -0,0 +1,191 @@
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Optional
+
+
+def normalize(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+class TranslationCache:
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        memory_entries: int = 4096,
+        disk_entries: int = 200000,
+        ttl: float = 7 * 24 * 3600,
+    ):
+        self.memory_entries = max(0, int(memory_entries))
+        self.disk_entries = max(0, int(disk_entries))
+        self.ttl = float(ttl) if ttl else 0.0
+        self._lock = threading.Lock()
+        self._mem = OrderedDict()
+        self._db = None
+        # disk reads and writes run here, off the caller's (event loop) thread
+        self.io = None
+        self._puts = 0
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self.evictions = 0
+        if path and self.disk_entries:
+            self._open(path)
+
+    def _open(self, path):
+        try:
+            d = os.path.dirname(path)
+            if d:
+                os.makedirs(d, exist_ok=True)
+            db = sqlite3.connect(path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "text TEXT NOT NULL, lang TEXT NOT NULL, backend TEXT NOT NULL, "
+                "value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL, "
+                "PRIMARY KEY (text, lang, backend))"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache(accessed)")
+            db.commit()
+            self._db = db
+            self.io = ThreadPoolExecutor(max_workers=1, thread_name_prefix="translation-cache")
+        except Exception as e:
+            print(f"translation cache disabled on disk ({path}):", e)
+            self._db = None
+
+    def _expired(self, created, now):
+        return self.ttl > 0 and now - created > self.ttl
+
+    def get(self, text: str, lang: str, backend: str) -> Optional[str]:
+        return self.get_any(text, lang, (backend,))
+
+    def get_any(
+        self, text: str, lang: str, backends: Iterable[str], disk: bool = True
+    ) -> Optional[str]:
+        # One lookup across several backends, counted as one hit or one miss.
+        # With disk=False only the memory tier is checked and a miss is left
+        # uncounted, so the caller can finish the lookup on self.io.
+        norm = normalize(text)
+        keys = [(norm, lang, backend) for backend in backends]
+        now = time.time()
+        with self._lock:
+            for key in keys:
+                item = self._mem.get(key)
+                if item is None:
+                    continue
+                value, created = item
+                if not self._expired(created, now):
+                    self._mem.move_to_end(key)
+                    self.hits_memory += 1
+                    return value
+                del self._mem[key]
+            if self._db is None or not disk:
+                if self._db is None:
+                    self.misses += 1
+                return None
+        try:
+            for key in keys:
+                row = self._db.execute(
+                    "SELECT value, created FROM cache WHERE text=? AND lang=? AND backend=?",
+                    key,
+                ).fetchone()
+                if row is None:
+                    continue
+                value, created = row
+                if self._expired(created, now):
+                    continue
+                self._db.execute(
+                    "UPDATE cache SET accessed=? WHERE text=? AND lang=? AND backend=?",
+                    (now,) + key,
+                )
+                with self._lock:
+                    self._remember(key, value, created)
+                    self.hits_disk += 1
+                return value
+        except sqlite3.Error as e:
+            print("translation cache read failed:", e)
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, text: str, lang: str, backend: str, value: str):
+        if not value:
+            return
+        key = (normalize(text), lang, backend)
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+        if self.io is not None:
+            self.io.submit(self._write, key, value, now)
+
+    def _write(self, key, value, now):
+        # runs on self.io, the only thread that touches the database
+        try:
+            self._db.execute(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?, ?)",
+                key + (value, now, now),
+            )
+            self._puts += 1
+            if self._puts % 256 == 0:
+                self._trim_disk(now)
+            self._db.commit()
+        except sqlite3.Error as e:
+            print("translation cache write failed:", e)
+
+    def _remember(self, key, value, created):
+        if not self.memory_entries:
+            return
+        self._mem[key] = (value, created)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.memory_entries:
+            self._mem.popitem(last=False)
+            self.evictions += 1
+
+    def _trim_disk(self, now):
+        evicted = 0
+        if self.ttl > 0:
+            cur = self._db.execute("DELETE FROM cache WHERE created < ?", (now - self.ttl,))
+            evicted += max(cur.rowcount, 0)
+        (count,) = self._db.execute("SELECT COUNT(*) FROM cache").fetchone()
+        extra = count - self.disk_entries
+        if extra > 0:
+            self._db.execute(
+                "DELETE FROM cache WHERE rowid IN "
+                "(SELECT rowid FROM cache ORDER BY accessed LIMIT ?)",
+                (extra,),
+            )
+            evicted += extra
+        with self._lock:
+            self.evictions += evicted
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits_memory + self.hits_disk + self.misses
+            return {
+                "entries_memory": len(self._mem),
+                "hits_memory": self.hits_memory,
+                "hits_disk": self.hits_disk,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (
+                    (self.hits_memory + self.hits_disk) / lookups if lookups else 0.0
+                ),
+            }
+
+    def close(self):
+        if self.io is not None:
+            self.io.shutdown(wait=True)
+            self.io = None
+        if self._db is not None:
+            try:
+                self._trim_disk(time.time())
+                self._db.commit()
+                self._db.close()
+            except sqlite3.Error:
+                pass
+            self._db = None
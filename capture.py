@@ -0,0 +1,230 @@
+import select
+import socket
+import struct
+import sys
+import traceback
+from typing import Callable, Optional, Tuple
+
+ETH_P_ALL = 0x0003
+ETH_P_IP = 0x0800
+VLAN_TYPES = (0x8100, 0x88A8)
+SOL_PACKET = 263
+PACKET_ADD_MEMBERSHIP = 1
+PACKET_MR_PROMISC = 1
+BATCH_SIZE = 256
+FRAME_SIZE = 65536
+
+FlowKey = Tuple[str, str, int, int]
+OnSegment = Callable[[FlowKey, int, int, memoryview], None]
+
+
+def build_bpf_filter(
+    ip: Optional[str] = None,
+    port_range: Optional[Tuple[int, int]] = None,
+    bpf: Optional[str] = None,
+) -> str:
+    if ip is None:
+        if port_range is not None:
+            pmin, pmax = port_range
+            bpf_filter = f"tcp and portrange {pmin}-{pmax}"
+        else:
+            bpf_filter = "tcp"
+    else:
+        if port_range is not None:
+            pmin, pmax = port_range
+            bpf_filter = f"tcp and host {ip} and portrange {pmin}-{pmax}"
+        else:
+            bpf_filter = f"tcp and host {ip}"
+    if bpf:
+        bpf_filter = f"({bpf_filter}) and ({bpf})"
+    return bpf_filter
+
+
+def parse_ipv4(
+    mv: memoryview,
+    off: int,
+    ip_filter: Optional[str] = None,
+    port_range: Optional[Tuple[int, int]] = None,
+):
+    if len(mv) < off + 20 or mv[off] >> 4 != 4 or mv[off + 9] != 6:
+        return None
+    if ((mv[off + 6] << 8) | mv[off + 7]) & 0x1FFF:
+        return None
+    ihl = (mv[off] & 0x0F) * 4
+    end = min(len(mv), off + ((mv[off + 2] << 8) | mv[off + 3]))
+    t = off + ihl
+    if end < t + 20:
+        return None
+    src_ip = socket.inet_ntoa(mv[off + 12 : off + 16].tobytes())
+    dst_ip = socket.inet_ntoa(mv[off + 16 : off + 20].tobytes())
+    if ip_filter is not None and src_ip != ip_filter and dst_ip != ip_filter:
+        return None
+    sport, dport, seq = struct.unpack_from(">HHI", mv, t)
+    if port_range is not None:
+        pmin, pmax = port_range
+        if not (pmin <= sport <= pmax or pmin <= dport <= pmax):
+            return None
+    data_off = (mv[t + 12] >> 4) * 4
+    flags = mv[t + 13]
+    return (src_ip, dst_ip, sport, dport), seq, flags, mv[t + data_off : end]
+
+
+def parse_ethernet(
+    frame,
+    ip_filter: Optional[str] = None,
+    port_range: Optional[Tuple[int, int]] = None,
+):
+    mv = memoryview(frame)
+    if len(mv) < 14:
+        return None
+    ethertype = (mv[12] << 8) | mv[13]
+    off = 14
+    while ethertype in VLAN_TYPES and len(mv) >= off + 4:
+        ethertype = (mv[off + 2] << 8) | mv[off + 3]
+        off += 4
+    if ethertype != ETH_P_IP:
+        return None
+    return parse_ipv4(mv, off, ip_filter, port_range)
+
+
+class Capture:
+    name = ""
+
+    def __init__(
+        self,
+        iface: str,
+        bpf_filter: str,
+        ip_filter: Optional[str] = None,
+        port_range: Optional[Tuple[int, int]] = None,
+        promisc: bool = False,
+    ):
+        self.iface = iface
+        self.bpf_filter = bpf_filter
+        self.ip_filter = ip_filter
+        self.port_range = port_range
+        self.promisc = promisc
+
+    def run(self, on_segment: OnSegment, stop_event):
+        raise NotImplementedError
+
+
+class AFPacketCapture(Capture):
+    name = "afpacket"
+
+    def _open(self) -> socket.socket:
+        sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ALL))
+        sock.bind((self.iface, 0))
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8 * 1024 * 1024)
+        except OSError:
+            pass
+        if self.promisc:
+            mreq = struct.pack(
+                "iHH8s", socket.if_nametoindex(self.iface), PACKET_MR_PROMISC, 0, b""
+            )
+            sock.setsockopt(SOL_PACKET, PACKET_ADD_MEMBERSHIP, mreq)
+        try:
+            from scapy.arch.linux import attach_filter
+
+            attach_filter(sock, self.bpf_filter, self.iface)
+        except Exception as e:
+            print(f"BPF filter not attached ({e}), filtering in userspace only")
+        sock.setblocking(False)
+        return sock
+
+    def run(self, on_segment: OnSegment, stop_event):
+        sock = self._open()
+        try:
+            while not stop_event.is_set():
+                ready, _, _ = select.select([sock], [], [], 0.2)
+                if not ready:
+                    continue
+                for _ in range(BATCH_SIZE):
+                    try:
+                        frame = sock.recv(FRAME_SIZE)
+                    except BlockingIOError:
+                        break
+                    seg = parse_ethernet(frame, self.ip_filter, self.port_range)
+                    if seg is not None:
+                        on_segment(*seg)
+        finally:
+            sock.close()
+
+
+class ScapyCapture(Capture):
+    name = "scapy"
+
+    def run(self, on_segment: OnSegment, stop_event):
+        from scapy.all import sniff, Raw, conf
+
+        conf.sniff_promisc = bool(self.promisc)
+        ip_filter = self.ip_filter
+        port_range = self.port_range
+
+        def _prn(pkt):
+            tcp_layer = pkt.getlayer("TCP")
+            ip_layer = pkt.getlayer("IP")
+            if tcp_layer is None or ip_layer is None:
+                return
+            src_ip = ip_layer.src
+            dst_ip = ip_layer.dst
+            sport = tcp_layer.sport
+            dport = tcp_layer.dport
+            if ip_filter is not None:
+                if not (src_ip == ip_filter or dst_ip == ip_filter):
+                    return
+            if port_range is not None:
+                pmin, pmax = port_range
+                if not (pmin <= sport <= pmax or pmin <= dport <= pmax):
+                    return
+            payload = pkt[Raw].load if pkt.haslayer(Raw) else b""
+            on_segment(
+                (src_ip, dst_ip, sport, dport), tcp_layer.seq, int(tcp_layer.flags), payload
+            )
+
+        sniff(
+            iface=self.iface,
+            filter=self.bpf_filter,
+            prn=_prn,
+            store=0,
+            stop_filter=lambda pkt: stop_event.is_set(),
+        )
+
+
+BACKENDS = {
+    AFPacketCapture.name: AFPacketCapture,
+    ScapyCapture.name: ScapyCapture,
+}
+
+
+def open_capture(backend: str = "auto", *args, **kwargs) -> Capture:
+    if backend == "auto":
+        backend = (
+            "afpacket"
+            if sys.platform.startswith("linux") and hasattr(socket, "AF_PACKET")
+            else "scapy"
+        )
+        if backend == "afpacket":
+            try:
+                socket.socket(socket.AF_PACKET, socket.SOCK_RAW, 0).close()
+            except OSError:
+                backend = "scapy"
+    cls = BACKENDS.get(backend)
+    if cls is None:
+        raise ValueError(f"unknown capture backend: {backend}")
+    return cls(*args, **kwargs)
+
+
+def run_capture(cap: Capture, on_segment: OnSegment, stop_event):
+    try:
+        cap.run(on_segment, stop_event)
+    except Exception:
+        traceback.print_exc()
+        if cap.name == "afpacket":
+            print("AF_PACKET capture failed, falling back to scapy")
+            fallback = ScapyCapture(
+                cap.iface, cap.bpf_filter, cap.ip_filter, cap.port_range, cap.promisc
+            )
+            run_capture(fallback, on_segment, stop_event)
+            return
+        raise
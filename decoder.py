@@ -0,0 +1,136 @@
+import logging
+import time
+from typing import Optional
+
+import snappy
+import net_pb2 as OverField_pb2
+from msg_id import MsgId
+from flow import FlowTable
+import metrics
+import profiling
+
+logger = logging.getLogger(__name__)
+
+id_to_name = {
+    v: k
+    for k, v in vars(MsgId).items()
+    if not k.startswith("__") and isinstance(v, int)
+}
+
+
+def _carries_chat(proto_cls) -> bool:
+    try:
+        field = proto_cls.DESCRIPTOR.fields_by_name.get("msg")
+    except AttributeError:
+        return False
+    return (
+        field is not None
+        and field.message_type is not None
+        and "text" in field.message_type.fields_by_name
+    )
+
+
+chat_protos = {}
+for _msgid, _name in id_to_name.items():
+    _cls = getattr(OverField_pb2, _name, None)
+    if _cls is not None and _carries_chat(_cls):
+        chat_protos[_msgid] = _cls
+
+decode_stats = {"decoded": 0, "skipped": 0, "skipped_bytes": 0}
+
+flow_buffers = FlowTable()
+TCP_FIN = 0x01
+TCP_SYN = 0x02
+TCP_RST = 0x04
+
+chat_handler = None
+segment_at = 0.0
+
+
+def _resync(fb, pos, end):
+    flow_buffers.tcp["resyncs"] += 1
+    nxt = fb.resync_from(pos)
+    return end if nxt is None else nxt
+
+
+def process_flow_buffer(flow_key):
+    fb = flow_buffers[flow_key]
+    mv = fb.view()
+    end = len(mv)
+    pos = 0
+    try:
+        while end - pos >= 2:
+            header_len = (mv[pos] << 8) | mv[pos + 1]
+            if header_len > 20 * 1024:
+                pos = _resync(fb, pos, end)
+                continue
+            if end - pos < 2 + header_len:
+                break
+            packet_head = OverField_pb2.PacketHead()
+            try:
+                packet_head.ParseFromString(mv[pos + 2 : pos + 2 + header_len])
+            except Exception:
+                pos = _resync(fb, pos, end)
+                continue
+            body_len = getattr(packet_head, "body_len", 0)
+            if body_len > flow_buffers.max_flow_bytes or (
+                fb.resyncing and packet_head.msg_id not in id_to_name
+            ):
+                pos = _resync(fb, pos, end)
+                continue
+            total_needed = 2 + header_len + body_len
+            if end - pos < total_needed:
+                break
+            if fb.resyncing:
+                fb.synced()
+            proto_cls = chat_protos.get(packet_head.msg_id)
+            if proto_cls is None:
+                pos += total_needed
+                decode_stats["skipped"] += 1
+                decode_stats["skipped_bytes"] += body_len
+                continue
+            body_data = mv[pos + 2 + header_len : pos + total_needed]
+            pos += total_needed
+            if getattr(packet_head, "flag", 0) == 1:
+                try:
+                    body_data = snappy.uncompress(body_data)
+                except Exception:
+                    continue
+            try:
+                sy = proto_cls()
+                sy.ParseFromString(body_data)
+                decode_stats["decoded"] += 1
+                txt = getattr(sy.msg, "text", "")
+                name = getattr(sy.msg, "name", "")
+                if txt and chat_handler is not None:
+                    chat_handler(name, txt)
+            except Exception:
+                continue
+    finally:
+        body_data = None
+        mv.release()
+        flow_buffers.consume(flow_key, pos)
+
+
+def pkt_callback(
+    flow_key, seq: Optional[int], tcp_flags: int, payload, now: Optional[float] = None
+):
+    global segment_at
+    segment_at = time.monotonic()
+    if profiling.active:
+        profiling.checkpoint()
+    if tcp_flags & TCP_SYN and seq is not None:
+        flow_buffers.open(flow_key, seq, now=now)
+    if payload:
+        flow_buffers.append(flow_key, payload, seq=seq, now=now)
+        try:
+            process_flow_buffer(flow_key)
+        except Exception:
+            pass
+        metrics.observe("decode", time.monotonic() - segment_at)
+    if tcp_flags & TCP_RST:
+        src_ip, dst_ip, sport, dport = flow_key
+        flow_buffers.close(flow_key)
+        flow_buffers.close((dst_ip, src_ip, dport, sport))
+    elif tcp_flags & TCP_FIN:
+        flow_buffers.close(flow_key)
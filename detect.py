@@ -0,0 +1,186 @@
+from typing import Optional
+
+LATIN = "latin"
+CYRILLIC = "cyrillic"
+
+_SCRIPTS = (
+    (0x0041, 0x024F, LATIN),
+    (0x0370, 0x03FF, "el"),
+    (0x0400, 0x052F, CYRILLIC),
+    (0x0590, 0x05FF, "he"),
+    (0x0600, 0x06FF, "ar"),
+    (0x0750, 0x077F, "ar"),
+    (0x0900, 0x097F, "hi"),
+    (0x0E00, 0x0E7F, "th"),
+    (0x1100, 0x11FF, "ko"),
+    (0x1E00, 0x1EFF, LATIN),
+    (0x3040, 0x30FF, "kana"),
+    (0x3130, 0x318F, "ko"),
+    (0x3400, 0x4DBF, "han"),
+    (0x4E00, 0x9FFF, "han"),
+    (0xAC00, 0xD7AF, "ko"),
+    (0xF900, 0xFAFF, "han"),
+    (0xFF21, 0xFF5A, LATIN),
+)
+
+_CYRILLIC_HINTS = (("uk", "іїєґ"), ("sr", "ђјљњћџ"), ("bg", "ъщ"))
+
+# Most frequent short words, including the chat shorthand that dominates game
+# lobbies, followed by the most frequent character trigrams (" " marks a word
+# boundary). Both are scored together, so a two-word message can be classified.
+_PROFILES = {
+    "en": (
+        "the and you to is it of in that for on are this i me my we be have "
+        "not with what was but can no yes ok okay lol gg wp ty thx pls plz "
+        "np idk brb afk omg wtf hi hello go just get they do so how why",
+        " th|the|he |nd | an|and|ing|ng | to|to | yo|you|ou | in|in |is | is|"
+        "it | it|at |on |er |re |hat|tha| wh|or |for| fo|ave|hav|ll |all|ight",
+    ),
+    "es": (
+        "de la que el en y a los se del las un por con no una su para es al "
+        "lo como más pero sus le ya o este sí porque esta muy qué hola bien",
+        " de|de | la|la |que|ue | qu|el | el|os | en|es |en |as |ar | co|ent|"
+        "los| lo|do |ado|on |ero|er |ien|ara| pa|par|con|est| es|ión|aci",
+    ),
+    "fr": (
+        "de la le et les des en un du une que est pour qui dans pas au sur "
+        "ne se ce il je tu vous nous avec mais oui non merci bonjour suis",
+        " de|de |es | le|le |ent|nt | la|la | et|et |les| co|que|ue | qu|"
+        "on |re | pa|ion|tio| po|ait|e d|s d|our|men| un|ous|vou|est| es",
+    ),
+    "pt": (
+        "de a o que e do da em um para é com não uma os no se na por mais as "
+        "dos como mas foi ao ele das tem sim você obrigado olá muito",
+        " de|de |os | qu|que|ue |ão | co|do | do|da | da|as | a |ar |ent|"
+        "em | em|com|não| nã|ra |ção|açã|est| pa|par|ara|nte|ado|men| se",
+    ),
+    "de": (
+        "der die und in den von zu das mit sich des auf für ist im dem nicht "
+        "ein eine als auch es an er hat aus bei sind ich du wir ja nein danke",
+        "en |er | de|der|ie |die| di|ch |ein| ei|und| un|nd |ich|che|sch|"
+        "den|in |te |cht| da|das|ung|gen|ine|es |ier|ber|nde| ge| zu",
+    ),
+    "it": (
+        "di e il la che a per un in è non una sono mi si ma lo ho le con del "
+        "della ti ci io tu sì grazie ciao bene come questo anche",
+        " di|di | ch|che|he |la | la|re | co|to | il|il |no |ion|are|ent|"
+        "lla|del| de|ell|one|ne |na |per| pe|ato|con|ere|non| no|a c",
+    ),
+    "nl": (
+        "de van het een en in is dat op te zijn die niet met voor je ik er "
+        "maar om aan ook als bij nog wel dan wat ja nee dank hoi",
+        "en | de|de |an |van| va|et |het| he|er |een| ee|n d|in |ing|nd |"
+        "ij | in| ge|oor|ver|aar|ie |t d|te |die| ee|ten|cht|sch|nie",
+    ),
+    "pl": (
+        "i w nie na się z do to że jest jak co ale o tak czy ja ty mi po za "
+        "jestem mnie dla już tylko może bardzo dzięki cześć",
+        "ie |nie| ni|ch | po| pr|rze|prz| na|ego|że | je|owa|ani|wie|dzi|"
+        "cze|ych|sz | za|ia |est|jes|ści| do|zy |ski|raz|ak |kie",
+    ),
+    "tr": (
+        "bir ve bu da de için ne ile çok ben sen o mı mi var yok ama gibi "
+        "daha evet hayır tamam değil nasıl neden teşekkürler merhaba",
+        "lar|ler|in |an |ın |bir| bi|ir |ar |er |en |eri|ını|da | ve|ve |"
+        "de |ak |la |le |nda|ası|esi|yor| ya|ara|ını|rin| ka|lan|ile",
+    ),
+    "id": (
+        "yang dan di itu dengan untuk tidak ini dari dalam akan pada juga saya "
+        "ke ada kamu aku apa bisa sudah belum ya gak nggak terima kasih",
+        "an |ang|ng | me|kan| di|yan| ya|ada|nga|ah |ber| be|men|eng|aka|"
+        "ka |in |dan|an | pe|per|ata| ke|ter| se|i d|n d|nya|ya |ala",
+    ),
+    "vi": (
+        "và của là có không được cho người này một những trong với các tôi "
+        "bạn đi thì rồi ạ nhé cảm ơn chào",
+        "ng |nh | kh|ông|không| ng|ch |của| củ| đư|ược|là | là|có | có|"
+        " tr|ngư|ười|i n| nh|hôn|ôn |ên |ột| mộ|ai |này|ày | và|và ",
+    ),
+}
+
+
+def _load_profiles():
+    profiles = {}
+    for lang, (words, trigrams) in _PROFILES.items():
+        profiles[lang] = (frozenset(words.split()), frozenset(trigrams.split("|")))
+    return profiles
+
+
+_profiles = _load_profiles()
+
+
+def _script(cp: int) -> Optional[str]:
+    for lo, hi, name in _SCRIPTS:
+        if cp < lo:
+            return None
+        if cp <= hi:
+            return name
+    return None
+
+
+def _latin(text: str) -> Optional[str]:
+    words = "".join(ch if ch.isalpha() else " " for ch in text.lower()).split()
+    if not words:
+        return None
+    scores = {}
+    for lang, (stopwords, trigrams) in _profiles.items():
+        score = 0
+        for word in words:
+            if word in stopwords:
+                score += 3
+            padded = f" {word} "
+            for i in range(len(padded) - 2):
+                if padded[i : i + 3] in trigrams:
+                    score += 1
+        scores[lang] = score
+    ranked = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
+    (best, top), (_, second) = ranked[0], ranked[1]
+    if top < 3 or top < second * 1.5:
+        return None
+    return best
+
+
+def detect(text: str) -> Optional[str]:
+    # "" means there are no letters at all (emoji, numbers, punctuation);
+    # None means the text could not be classified confidently.
+    counts = {}
+    letters = 0
+    for ch in text:
+        if not ch.isalpha():
+            continue
+        letters += 1
+        script = _script(ord(ch))
+        if script is not None:
+            counts[script] = counts.get(script, 0) + 1
+    if letters == 0:
+        return ""
+    if not counts:
+        return None
+    if "kana" in counts:
+        counts["ja"] = counts.pop("kana") + counts.pop("han", 0)
+    elif "han" in counts:
+        counts["zh"] = counts.pop("han")
+    script, n = max(counts.items(), key=lambda kv: kv[1])
+    if n < letters * 0.8:
+        return None
+    if script == LATIN:
+        return _latin(text)
+    if script == CYRILLIC:
+        for lang, chars in _CYRILLIC_HINTS:
+            if any(c in chars for c in text.lower()):
+                return lang
+        return "ru"
+    return script
+
+
+def lang_code(lang: str) -> str:
+    return lang.lower().replace("_", "-").split("-")[0]
+
+
+def skip_reason(text: str, target: str) -> Optional[str]:
+    lang = detect(text)
+    if lang == "":
+        return "no_letters"
+    if lang is not None and lang == lang_code(target):
+        return "target_lang"
+    return None
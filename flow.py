@@ -0,0 +1,272 @@
+import time
+from collections import OrderedDict, deque
+from typing import Optional
+
+COMPACT_MIN = 64 * 1024
+SEQ_MASK = 0xFFFFFFFF
+GAP_TIMEOUT = 1.0
+MAX_OOO_BYTES = 256 * 1024
+
+
+def seq_diff(a: int, b: int) -> int:
+    d = (a - b) & SEQ_MASK
+    return d - 0x100000000 if d & 0x80000000 else d
+
+
+class FlowBuffer:
+    __slots__ = (
+        "_buf",
+        "_off",
+        "_pos0",
+        "next_seq",
+        "_ooo",
+        "_ooo_bytes",
+        "_gap_since",
+        "_marks",
+        "resyncing",
+    )
+
+    def __init__(self):
+        self._buf = bytearray()
+        self._off = 0
+        self._pos0 = 0
+        self.next_seq = None
+        self._ooo = {}
+        self._ooo_bytes = 0
+        self._gap_since = None
+        self._marks = deque()
+        self.resyncing = False
+
+    def __len__(self):
+        return len(self._buf) - self._off
+
+    def held(self) -> int:
+        return len(self) + self._ooo_bytes
+
+    def extend(self, data):
+        if self._off and self._off == len(self._buf):
+            self._reset()
+        if self.resyncing:
+            mark = self._pos0 + len(self)
+            if not self._marks or self._marks[-1] != mark:
+                self._marks.append(mark)
+        try:
+            self._buf += data
+        except BufferError:
+            self._buf = self._buf[self._off :] + data
+            self._off = 0
+
+    def open(self, isn: int):
+        self.clear()
+        self.next_seq = (isn + 1) & SEQ_MASK
+
+    def insert(self, seq: Optional[int], data, now: float, counters: dict):
+        if seq is None:
+            self.extend(data)
+            return
+        if self.next_seq is None:
+            self.next_seq = seq
+            self.lost_sync()
+        d = seq_diff(seq, self.next_seq)
+        n = len(data)
+        if d + n <= 0:
+            counters["duplicates"] += 1
+            return
+        if d <= 0:
+            self._append(data[-d:] if d else data)
+            if self._ooo:
+                self._drain()
+        else:
+            counters["out_of_order"] += 1
+            old = self._ooo.get(seq)
+            if old is None or len(old) < n:
+                self._ooo[seq] = data
+                self._ooo_bytes += n - (len(old) if old is not None else 0)
+            if self._gap_since is None:
+                self._gap_since = now
+        if self._ooo and (
+            now - self._gap_since >= GAP_TIMEOUT or self._ooo_bytes > MAX_OOO_BYTES
+        ):
+            counters["gaps"] += 1
+            self._skip_gap()
+
+    def _append(self, data):
+        self.extend(data)
+        self.next_seq = (self.next_seq + len(data)) & SEQ_MASK
+
+    def _drain(self):
+        progressed = True
+        while self._ooo and progressed:
+            progressed = False
+            for seq in list(self._ooo):
+                d = seq_diff(seq, self.next_seq)
+                if d > 0:
+                    continue
+                data = self._ooo.pop(seq)
+                self._ooo_bytes -= len(data)
+                if d + len(data) > 0:
+                    self._append(data[-d:] if d else data)
+                progressed = True
+        if not self._ooo:
+            self._gap_since = None
+
+    def _skip_gap(self):
+        first = min(self._ooo, key=lambda s: seq_diff(s, self.next_seq))
+        self._pos0 += len(self)
+        self._reset()
+        self.next_seq = first
+        self.resyncing = False
+        self.lost_sync()
+        self._drain()
+
+    def lost_sync(self):
+        if not self.resyncing:
+            self.resyncing = True
+            self._marks.clear()
+            self._marks.append(self._pos0 + len(self))
+
+    def synced(self):
+        self.resyncing = False
+        self._marks.clear()
+
+    def resync_from(self, pos: int) -> Optional[int]:
+        self.lost_sync()
+        start = self._pos0 + pos
+        for mark in self._marks:
+            if mark > start:
+                return mark - self._pos0
+        return None
+
+    def view(self) -> memoryview:
+        return memoryview(self._buf)[self._off :]
+
+    def consume(self, n: int):
+        n = min(n, len(self))
+        self._off += n
+        self._pos0 += n
+        while self._marks and self._marks[0] < self._pos0:
+            self._marks.popleft()
+        if self._off == len(self._buf):
+            self._reset()
+        elif self._off >= COMPACT_MIN and self._off * 2 >= len(self._buf):
+            try:
+                del self._buf[: self._off]
+                self._off = 0
+            except BufferError:
+                pass
+
+    def clear(self):
+        self._pos0 += len(self)
+        self._reset()
+        self.next_seq = None
+        self._ooo.clear()
+        self._ooo_bytes = 0
+        self._gap_since = None
+        self._marks.clear()
+        self.resyncing = False
+
+    def _reset(self):
+        try:
+            self._buf.clear()
+        except BufferError:
+            self._buf = bytearray()
+        self._off = 0
+
+
+class FlowTable:
+    def __init__(
+        self,
+        idle_timeout: float = 120.0,
+        max_flow_bytes: int = 4 * 1024 * 1024,
+        max_total_bytes: int = 32 * 1024 * 1024,
+    ):
+        self.idle_timeout = idle_timeout
+        self.max_flow_bytes = max_flow_bytes
+        self.max_total_bytes = max_total_bytes
+        self._flows = OrderedDict()
+        self.bytes_held = 0
+        self.evictions = {"idle": 0, "flow_cap": 0, "total_cap": 0, "closed": 0}
+        self.tcp = {"duplicates": 0, "out_of_order": 0, "gaps": 0, "resyncs": 0}
+
+    def configure(self, cfg: dict):
+        self.idle_timeout = float(cfg.get("idle_timeout", self.idle_timeout))
+        self.max_flow_bytes = int(cfg.get("max_flow_bytes", self.max_flow_bytes))
+        self.max_total_bytes = int(cfg.get("max_total_bytes", self.max_total_bytes))
+
+    def __len__(self):
+        return len(self._flows)
+
+    def __contains__(self, flow_key):
+        return flow_key in self._flows
+
+    def __getitem__(self, flow_key) -> FlowBuffer:
+        return self._flows[flow_key][0]
+
+    def _touch(self, flow_key, now: float) -> FlowBuffer:
+        self.expire(now)
+        entry = self._flows.get(flow_key)
+        fb = FlowBuffer() if entry is None else entry[0]
+        self._flows[flow_key] = (fb, now)
+        self._flows.move_to_end(flow_key)
+        return fb
+
+    def open(self, flow_key, isn: int, now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
+        fb = self._touch(flow_key, now)
+        self.bytes_held -= fb.held()
+        fb.open(isn)
+
+    def append(
+        self, flow_key, data, seq: Optional[int] = None, now: Optional[float] = None
+    ) -> FlowBuffer:
+        now = time.monotonic() if now is None else now
+        fb = self._touch(flow_key, now)
+        if fb.held() + len(data) > self.max_flow_bytes:
+            self.bytes_held -= fb.held()
+            fb.clear()
+            self.evictions["flow_cap"] += 1
+            if len(data) > self.max_flow_bytes:
+                return fb
+        before = fb.held()
+        fb.insert(seq, data, now, self.tcp)
+        self.bytes_held += fb.held() - before
+        while self.bytes_held > self.max_total_bytes and len(self._flows) > 1:
+            oldest = next(iter(self._flows))
+            if oldest == flow_key:
+                break
+            self._evict(oldest, "total_cap")
+        return fb
+
+    def consume(self, flow_key, n: int):
+        entry = self._flows.get(flow_key)
+        if entry is None or n <= 0:
+            return
+        before = entry[0].held()
+        entry[0].consume(n)
+        self.bytes_held -= before - entry[0].held()
+
+    def close(self, flow_key):
+        if flow_key in self._flows:
+            self._evict(flow_key, "closed")
+
+    def expire(self, now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
+        while self._flows:
+            flow_key, (fb, last_seen) = next(iter(self._flows.items()))
+            if now - last_seen < self.idle_timeout:
+                break
+            self._evict(flow_key, "idle")
+
+    def _evict(self, flow_key, reason: str):
+        fb, _ = self._flows.pop(flow_key)
+        self.bytes_held -= fb.held()
+        fb.clear()
+        self.evictions[reason] += 1
+
+    def stats(self) -> dict:
+        return {
+            "active_flows": len(self._flows),
+            "bytes_held": self.bytes_held,
+            "evictions": dict(self.evictions),
+            "tcp": dict(self.tcp),
+        }
@@ -0,0 +1,154 @@
+import re
+from collections import deque
+from typing import Dict, List, Tuple
+
+PLACEHOLDER = "⟦{}⟧"
+_placeholder_re = re.compile(r"⟦\s*(\d+)\s*⟧")
+
+
+def _fold(text: str) -> str:
+    # per-character lowercase that keeps indices aligned with the original
+    out = []
+    for ch in text:
+        low = ch.lower()
+        out.append(low if len(low) == 1 else ch)
+    return "".join(out)
+
+
+def _spaced(ch: str) -> bool:
+    return ch.isalnum() and ord(ch) < 0x2E80
+
+
+class Glossary:
+    # Aho-Corasick automaton over case-folded terms: one pass over a line finds
+    # every occurrence of every term, whatever the size of the glossary.
+
+    def __init__(self, terms: Dict[str, str]):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+        self._terms = []
+        for src, dst in terms.items():
+            key = _fold(str(src).strip())
+            if key and dst is not None:
+                self._add(key, str(dst))
+        self._build()
+
+    def __len__(self):
+        return len(self._terms)
+
+    def _add(self, key: str, translation: str):
+        node = 0
+        for ch in key:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            node = nxt
+        if self._out[node]:
+            self._terms[self._out[node][0]] = (len(key), translation)
+            return
+        self._out[node] = (len(self._terms),)
+        self._terms.append((len(key), translation))
+
+    def _build(self):
+        goto, fail, out = self._goto, self._fail, self._out
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in goto[node].items():
+                queue.append(nxt)
+                f = fail[node]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0) if goto[f].get(ch, 0) != nxt else 0
+                out[nxt] = out[nxt] + out[fail[nxt]]
+
+    def find(self, text: str) -> List[Tuple[int, int, int]]:
+        goto, fail, out, terms = self._goto, self._fail, self._out, self._terms
+        s = _fold(text)
+        n = len(s)
+        matches = []
+        node = 0
+        for i, ch in enumerate(s):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for idx in out[node]:
+                end = i + 1
+                start = end - terms[idx][0]
+                if start > 0 and _spaced(s[start]) and _spaced(s[start - 1]):
+                    continue
+                if end < n and _spaced(s[end - 1]) and _spaced(s[end]):
+                    continue
+                matches.append((start, end, idx))
+        if not matches:
+            return matches
+        # leftmost-longest, non-overlapping
+        matches.sort(key=lambda m: (m[0], m[0] - m[1]))
+        chosen = []
+        pos = 0
+        for m in matches:
+            if m[0] >= pos:
+                chosen.append(m)
+                pos = m[1]
+        return chosen
+
+    def protect(self, text: str) -> Tuple[str, List[str]]:
+        matches = self.find(text)
+        if not matches:
+            return text, []
+        parts = []
+        replacements = []
+        pos = 0
+        for start, end, idx in matches:
+            parts.append(text[pos:start])
+            parts.append(PLACEHOLDER.format(len(replacements)))
+            replacements.append(self._terms[idx][1])
+            pos = end
+        parts.append(text[pos:])
+        return "".join(parts), replacements
+
+
+def restore(text: str, replacements: List[str]) -> str:
+    if not replacements:
+        return text
+
+    def sub(m):
+        i = int(m.group(1))
+        return replacements[i] if i < len(replacements) else m.group(0)
+
+    return _placeholder_re.sub(sub, text)
+
+
+def restore_partial(text: str, replacements: List[str]) -> str:
+    # a streamed translation may end halfway through a placeholder
+    cut = text.rfind("⟦")
+    if cut > text.rfind("⟧"):
+        text = text[:cut].rstrip()
+    return restore(text, replacements)
+
+
+def only_terms(protected: str) -> bool:
+    return not any(ch.isalpha() for ch in _placeholder_re.sub("", protected))
+
+
+def load_terms(cfg: dict) -> Dict[str, str]:
+    terms = {}
+    path = cfg.get("file")
+    if path:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.rstrip("\n")
+                    if not line or line.startswith("#") or "\t" not in line:
+                        continue
+                    src, dst = line.split("\t", 1)
+                    terms[src.strip()] = dst.strip()
+        except OSError as e:
+            print(f"glossary file not loaded: {e}")
+    terms.update(cfg.get("terms") or {})
+    return terms
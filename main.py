@@ -1,9 +1,9 @@
 #!/usr/bin/env python3
-import struct
+import argparse
 import threading
+from collections import deque
+from concurrent.futures import Future
 import time
-from collections import defaultdict
-from concurrent.futures import ThreadPoolExecutor, TimeoutError
 from typing import Optional, Tuple
 import os
 import sys
@@ -11,176 +11,323 @@ import sys
 import psutil
 import traceback
 import socket
-from scapy.all import sniff, Raw, conf
-import snappy
-import net_pb2 as OverField_pb2
-from msg_id import MsgId
 import logging
 import yaml
-from ui import create_floating_window, send_text
+import ui
+from ui import create_floating_window, send_text, update_text
 import translate
+import decoder
+import capture
+import replay
+import pipeline
+import metrics
+import profiling
+import multiprocessing
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-id_to_name = {
-    v: k
-    for k, v in vars(MsgId).items()
-    if not k.startswith("__") and isinstance(v, int)
-}
-
-flow_buffers = defaultdict(bytearray)
-
-executor = ThreadPoolExecutor(max_workers=8)
+headless = False
 pending_lock = threading.Lock()
+pending_cond = threading.Condition(pending_lock)
 pending = {}
 next_seq = 0
 print_seq = 0
+display_order = "strict"
+reorder_window = 8
+intake = deque()
+queued_texts = {}
+inflight = 0
+intake_max_queue = 64
+intake_max_inflight = 16
+intake_policy = "drop_oldest"
+intake_counters = {"dropped": 0, "deduplicated": 0, "merged": 0, "max_depth": 0}
+MERGE_LIMIT = 400
+
+
+class _Pending:
+    __slots__ = (
+        "seq",
+        "name",
+        "text",
+        "future",
+        "deadline",
+        "released",
+        "shed",
+        "followers",
+        "captured",
+        "enqueued",
+        "dispatched",
+        "done_at",
+        "local",
+    )
+
+    def __init__(self, seq, name, text, deadline, captured, enqueued):
+        self.seq = seq
+        self.name = name
+        self.text = text
+        self.future = None
+        self.deadline = deadline
+        self.released = False
+        self.shed = None
+        self.followers = []
+        self.captured = captured
+        self.enqueued = enqueued
+        self.dispatched = None
+        self.done_at = None
+        self.local = False
+
+
+def configure_display(cfg: dict):
+    global display_order, reorder_window
+    display_order = cfg.get("order", display_order)
+    reorder_window = max(1, int(cfg.get("reorder_window", reorder_window)))
+
+
+def configure_intake(cfg: dict):
+    global intake_max_queue, intake_max_inflight, intake_policy
+    intake_max_queue = max(1, int(cfg.get("max_queue", intake_max_queue)))
+    intake_max_inflight = max(1, int(cfg.get("max_inflight", intake_max_inflight)))
+    intake_policy = cfg.get("policy", intake_policy)
+    if intake_policy not in ("drop_oldest", "drop_duplicates", "merge"):
+        logger.warning("unknown intake policy %r, using drop_oldest", intake_policy)
+        intake_policy = "drop_oldest"
+
+
+def intake_stats() -> dict:
+    with pending_lock:
+        return dict(intake_counters, depth=len(intake), inflight=inflight)
+
+
+def start_metrics(cfg: dict):
+    metrics.gauge("intake_depth", lambda: len(intake))
+    metrics.gauge("translations_inflight", lambda: inflight)
+    metrics.gauge("lines_pending_display", lambda: len(pending))
+    metrics.gauge("flow_bytes_held", lambda: decoder.flow_buffers.bytes_held)
+    metrics.gauge("flows_active", lambda: len(decoder.flow_buffers))
+    metrics.start(cfg)
+
+
+def start_profiling(cfg: dict):
+    profiling.track("flow_buffers", decoder.flow_buffers.stats)
+    profiling.track("pending", lambda: {"lines": len(pending), **intake_stats()})
+    profiling.configure(cfg)
+    ui.hotkeys["F9"] = profiling.toggle
+    ui.hotkeys["F10"] = profiling.snapshot
+
+
+def display(text: str, msg_id: Optional[int] = None, state: str = "done"):
+    if headless:
+        print(text, flush=True)
+    elif msg_id is None:
+        send_text(text)
+    else:
+        update_text(msg_id, text, state)
+
+
+def _on_translated(item: _Pending, leader: bool):
+    def done(_future):
+        global inflight
+        item.done_at = time.monotonic()
+        metrics.observe("translate", item.done_at - item.dispatched)
+        with pending_cond:
+            if leader:
+                inflight -= 1
+            pending_cond.notify()
+        if leader:
+            _dispatch()
+
+    return done
+
+
+def _on_partial(item: _Pending):
+    def partial(so_far: str):
+        with pending_lock:
+            # once the line is final, a late partial must not overwrite it
+            if item.released:
+                return
+            update_text(item.seq, f"{item.name}>>>{so_far}", "partial")
+
+    return partial
+
+
+def _dispatch():
+    global inflight
+    batch = []
+    with pending_lock:
+        while intake and inflight < intake_max_inflight:
+            item = intake.popleft()
+            if queued_texts.get(item.text) is item:
+                del queued_texts[item.text]
+            inflight += 1
+            batch.append(item)
+    now = time.monotonic()
+    for item in batch:
+        metrics.observe("queue_wait", now - item.enqueued)
+        for follower in item.followers:
+            if follower.released:
+                continue
+            follower.dispatched = now
+            follower.future = translate.submit(
+                follower.text, None if headless else _on_partial(follower), checked=True
+            )
+            follower.future.add_done_callback(_on_translated(follower, False))
+        item.dispatched = now
+        item.future = translate.submit(
+            item.text, None if headless else _on_partial(item), checked=True
+        )
+        item.future.add_done_callback(_on_translated(item, True))
+
+
+def _unqueue(item: _Pending, reason: str):
+    # caller holds pending_lock
+    try:
+        intake.remove(item)
+    except ValueError:
+        return
+    if queued_texts.get(item.text) is item:
+        del queued_texts[item.text]
+    for shed in [item] + item.followers:
+        if shed.future is None and shed.shed is None:
+            shed.shed = reason
+            if reason == "dropped":
+                intake_counters["dropped"] += 1
+    pending_cond.notify()
+
+
+def _answer_locally(name: str, answer: str, deadline: float, captured: float, now: float):
+    # Lines that need no backend never take a queue or in-flight slot; they
+    # only keep their place in the display order.
+    global next_seq
+    future = Future()
+    future.set_result(answer)
+    with pending_cond:
+        seq = next_seq
+        next_seq += 1
+        item = pending[seq] = _Pending(seq, name, answer, deadline, captured, now)
+        item.future = future
+        item.dispatched = item.done_at = now
+        item.local = True
+        if not headless:
+            send_text(f"{name}>>>{answer}", seq)
+            update_text(seq, f"{name}>>>{answer}")
+        pending_cond.notify()
 
 
-def schedule_translation(name: str, text: str):
+def schedule_translation(name: str, text: str, captured_at: Optional[float] = None):
     global next_seq
+    now = time.monotonic()
+    if captured_at is None:
+        captured_at = decoder.segment_at or now
+    metrics.observe("capture_to_enqueue", now - captured_at)
+    deadline = now + translate.TRANSLATION_TIMEOUT
+    answer = translate.local_answer(text)
+    if answer is not None:
+        _answer_locally(name, answer, deadline, captured_at, now)
+        return
     with pending_lock:
+        if intake and intake_policy == "merge":
+            last = intake[-1]
+            if last.name == name and not last.followers and len(last.text) + len(text) < MERGE_LIMIT:
+                last.text = f"{last.text} / {text}"
+                intake_counters["merged"] += 1
+                if not headless:
+                    update_text(last.seq, f"{name}>>>{last.text}", "pending")
+                return
         seq = next_seq
         next_seq += 1
-        future = executor.submit(translate.translate_text, text)
-        pending[seq] = (name, future)
+        item = pending[seq] = _Pending(seq, name, text, deadline, captured_at, now)
+        if not headless:
+            send_text(f"{name}>>>{text}", seq)
+        if intake_policy == "drop_duplicates":
+            leader = queued_texts.get(text)
+            if leader is not None:
+                leader.followers.append(item)
+                intake_counters["deduplicated"] += 1
+                return
+            queued_texts[text] = item
+        if len(intake) >= intake_max_queue:
+            _unqueue(intake[0], "dropped")
+        intake.append(item)
+        intake_counters["max_depth"] = max(intake_counters["max_depth"], len(intake))
+    _dispatch()
 
 
-def printer_loop(stop_event: threading.Event):
+def _collect_ready(now: float):
     global print_seq
-    while True:
-        with pending_lock:
-            has_next = print_seq in pending
-        if not has_next:
-            if stop_event.is_set():
-                with pending_lock:
-                    if not pending:
-                        break
-                time.sleep(0.05)
+    window = reorder_window if display_order == "best_effort" else 1
+    ready = []
+    progressed = True
+    while progressed:
+        progressed = False
+        for seq in range(print_seq, min(print_seq + window, next_seq)):
+            item = pending[seq]
+            if item.released:
                 continue
-            time.sleep(0.05)
-            continue
-        with pending_lock:
-            name, future = pending[print_seq]
-        try:
-            res = future.result(timeout=translate.TRANSLATION_TIMEOUT)
-            if res:
-                text = f"{name}>>>{res}"
-                try:
-                    send_text(text)
-                except Exception:
-                    logger.exception("send_text failed")
-        except TimeoutError:
-            pass
-        except Exception:
-            pass
-        with pending_lock:
-            try:
-                del pending[print_seq]
-            except KeyError:
-                pass
-        print_seq += 1
+            if item.shed or now >= item.deadline:
+                _unqueue(item, "timeout")
+            elif item.future is None or not item.future.done():
+                continue
+            item.released = True
+            ready.append(item)
+        while print_seq < next_seq and pending[print_seq].released:
+            del pending[print_seq]
+            print_seq += 1
+            progressed = True
+    next_deadline = None
+    for seq in range(print_seq, min(print_seq + window, next_seq)):
+        item = pending[seq]
+        if not item.released and (next_deadline is None or item.deadline < next_deadline):
+            next_deadline = item.deadline
+    return ready, next_deadline
 
 
-def process_flow_buffer(flow_key):
-    buf = flow_buffers[flow_key]
-    while True:
-        if len(buf) < 2:
-            break
-        try:
-            header_len = struct.unpack(">H", buf[0:2])[0]
-            if header_len > 20 * 1024:
-                del buf[:2]
-                continue
-        except Exception:
-            try:
-                del buf[:2]
-            except Exception:
-                break
-            continue
-        if len(buf) < 2 + header_len:
-            break
-        header_data = bytes(buf[2 : 2 + header_len])
-        packet_head = OverField_pb2.PacketHead()
+def _deliver(item: _Pending):
+    res = None
+    state = "done"
+    if item.future is None:
+        state = item.shed or "timeout"
+    elif item.future.done():
         try:
-            packet_head.ParseFromString(header_data)
+            res = item.future.result()
         except Exception:
-            try:
-                del buf[:2]
-            except Exception:
-                break
-            continue
-        total_needed = 2 + header_len + getattr(packet_head, "body_len", 0)
-        if len(buf) < total_needed:
-            break
-        body_data = bytes(buf[2 + header_len : 2 + header_len + packet_head.body_len])
-        try:
-            del buf[:total_needed]
-        except Exception:
-            break
-        if getattr(packet_head, "flag", 0) == 1:
-            try:
-                body_data = snappy.uncompress(body_data)
-            except Exception:
-                try:
-                    del buf[:2]
-                except Exception:
-                    pass
-                continue
-        msgid = getattr(packet_head, "msg_id", None)
-        if msgid is None:
-            continue
-        proto_name = id_to_name.get(msgid)
-        proto_cls = getattr(OverField_pb2, proto_name, None)
-        if proto_cls is None:
-            continue
-        try:
-            sy = proto_cls()
-            sy.ParseFromString(body_data)
-            txt = getattr(sy.msg, "text", "")
-            name = getattr(sy.msg, "name", "")
-            if txt:
-                schedule_translation(name, txt)
-        except Exception:
-            continue
-
-
-def pkt_callback(
-    pkt,
-    ip_filter: Optional[str],
-    port_range: Optional[Tuple[int, int]],
-    stop_event: Optional[threading.Event] = None,
-):
-    if stop_event is not None and stop_event.is_set():
-        return False
-    if not pkt.haslayer(Raw):
-        return
-    ip_layer = pkt.getlayer("IP")
-    if ip_layer is None:
-        return
-    src_ip = ip_layer.src
-    dst_ip = ip_layer.dst
-    sport = getattr(pkt.payload, "sport", None)
-    dport = getattr(pkt.payload, "dport", None)
-    if ip_filter is not None:
-        if not (src_ip == ip_filter or dst_ip == ip_filter):
-            return
-    if port_range is not None:
-        pmin, pmax = port_range
-        sport_ok = sport is not None and pmin <= sport <= pmax
-        dport_ok = dport is not None and pmin <= dport <= pmax
-        if not (sport_ok or dport_ok):
-            return
-    payload = bytes(pkt[Raw].load)
-    if not payload:
-        return
-    flow_key = (src_ip, dst_ip, sport, dport)
-    flow_buffers[flow_key].extend(payload)
+            state = "failed"
+    else:
+        item.future.cancel()
+        state = "timeout"
+    if state == "done" and not res:
+        state = "failed"
     try:
-        process_flow_buffer(flow_key)
+        # the overlay already shows a locally answered line in its final form
+        if headless or not item.local:
+            display(f"{item.name}>>>{res or item.text}", item.seq, state)
     except Exception:
-        pass
+        logger.exception("send_text failed")
+    now = time.monotonic()
+    if item.done_at is not None:
+        metrics.observe("display_wait", now - item.done_at)
+    metrics.observe("end_to_end", now - item.captured)
+    metrics.inc("messages", state=state)
+
+
+def printer_loop(stop_event: threading.Event):
+    while True:
+        with pending_cond:
+            while True:
+                now = time.monotonic()
+                ready, next_deadline = _collect_ready(now)
+                if ready:
+                    break
+                if stop_event.is_set() and not pending:
+                    return
+                if profiling.active:
+                    profiling.checkpoint()
+                timeout = 0.25
+                if next_deadline is not None:
+                    timeout = min(timeout, max(0.0, next_deadline - now))
+                pending_cond.wait(timeout)
+        for item in ready:
+            _deliver(item)
 
 
 def start_sniffer(
@@ -190,39 +337,16 @@ def start_sniffer(
     stop_event: threading.Event,
     bpf: Optional[str] = None,
     promisc: bool = False,
+    backend: str = "auto",
 ):
-    if ip is None:
-        if port_range is not None:
-            pmin, pmax = port_range
-            bpf_filter = f"tcp and portrange {pmin}-{pmax}"
-        else:
-            bpf_filter = "tcp"
-    else:
-        if port_range is not None:
-            pmin, pmax = port_range
-            bpf_filter = f"tcp and host {ip} and portrange {pmin}-{pmax}"
-        else:
-            bpf_filter = f"tcp and host {ip}"
-    if bpf:
-        bpf_filter = f"({bpf_filter}) and ({bpf})"
-    conf.sniff_promisc = bool(promisc)
-
-    def _stop_filter(pkt):
-        return stop_event.is_set()
-
-    def _prn_wrapper(pkt):
-        return pkt_callback(
-            pkt, ip_filter=ip, port_range=port_range, stop_event=stop_event
-        )
+    bpf_filter = capture.build_bpf_filter(ip, port_range, bpf)
 
     try:
-        sniff(
-            iface=iface,
-            filter=bpf_filter,
-            prn=_prn_wrapper,
-            store=0,
-            stop_filter=_stop_filter,
+        cap = capture.open_capture(
+            backend, iface, bpf_filter, ip_filter=ip, port_range=port_range, promisc=promisc
         )
+        logger.info("capture backend: %s", cap.name)
+        capture.run_capture(cap, decoder.pkt_callback, stop_event)
     except Exception as e:
         traceback.print_exc()
         print(
@@ -264,7 +388,7 @@ def find_external_config(filename="config.json"):
     return None
 
 
-def main():
+def load_config() -> dict:
     try:
         config_path = find_external_config("config.yaml")
         with open(config_path, "r", encoding="utf-8") as f:
@@ -275,7 +399,175 @@ def main():
             "config.json load failed! use default config. You can access https://github.com/byzp/of-translate/blob/main/config.yaml Download this file"
         )
         cfg = {}
+    return cfg
+
+
+def log_stats():
+    logger.info("flow table: %s", decoder.flow_buffers.stats())
+    logger.info("decoder: %s", decoder.decode_stats)
+    logger.info("translation cache: %s", translate.cache_stats())
+    logger.info("hedged requests: %s", translate.hedge_stats())
+    logger.info("skipped before translation: %s", translate.skip_stats())
+    logger.info("in-flight translations: %s", translate.inflight_stats())
+    logger.info("glossary: %s", translate.glossary_stats())
+    logger.info("intake queue: %s", intake_stats())
+    logger.info("backend rate limits: %s", translate.rate_stats())
+    logger.info("backend health: %s", translate.health_stats())
+    if metrics.enabled:
+        logger.info("stage latency: %s", metrics.summary())
+
+
+def wait_for_pending(stop_evt: threading.Event, printer_thread: threading.Thread):
+    while printer_thread.is_alive():
+        with pending_lock:
+            if not pending:
+                break
+        time.sleep(0.05)
+    stop_evt.set()
+    printer_thread.join(timeout=5)
+
+
+def run_pipeline(
+    iface: str,
+    backend: str,
+    pipeline_cfg: dict,
+    cfg: dict,
+    stop_evt: threading.Event,
+    printer_thread: threading.Thread,
+):
+    pipe = pipeline.Pipeline(
+        workers=pipeline_cfg.get("workers", 2),
+        ring_bytes=pipeline_cfg.get("ring_bytes", 8 * 1024 * 1024),
+        backend=backend,
+        iface=iface,
+        bpf_filter=capture.build_bpf_filter(None, (11001, 11003)),
+        ip=None,
+        port_range=(11001, 11003),
+        promisc=False,
+        flows_cfg=cfg.get("flows") or {},
+        on_chat=schedule_translation,
+    )
+    pipe.start()
+    time.sleep(1)
+    send_text(
+        f"Started, listening on adapter: {iface} ({pipe.workers} decoder processes)"
+    )
+    try:
+        while pipe.is_alive():
+            time.sleep(0.2)
+    except KeyboardInterrupt:
+        pass
+    pipe.stop()
+    stop_evt.set()
+    printer_thread.join(timeout=5)
+    logger.info("pipeline: %s", pipe.stats())
+    log_stats()
+    translate.close()
+    profiling.stop()
+
+
+def run_replay(args, cfg: dict):
+    global headless
+    headless = not args.ui
+    # without a configured engine translate.submit hands every line back as is,
+    # so no backend, plugin, glossary or cache is involved
+    if not args.no_translate:
+        translate.configure(cfg)
+    decoder.flow_buffers.configure(cfg.get("flows") or {})
+    decoder.chat_handler = schedule_translation
+    configure_display(cfg.get("display") or {})
+    configure_intake(cfg.get("intake") or {})
+    start_metrics(cfg.get("metrics") or {})
+    start_profiling(cfg.get("profiling") or {})
+    if args.ui:
+        threading.Thread(target=create_floating_window, daemon=True).start()
+
+    decode_cpu = [0.0]
+    decode = decoder.process_flow_buffer
+
+    def timed_decode(flow_key):
+        t0 = time.thread_time()
+        try:
+            decode(flow_key)
+        finally:
+            decode_cpu[0] += time.thread_time() - t0
+
+    decoder.process_flow_buffer = timed_decode
+    stop_evt = threading.Event()
+    printer_thread = threading.Thread(target=printer_loop, args=(stop_evt,))
+    printer_thread.start()
+    wall0 = time.perf_counter()
+    cpu0 = time.process_time()
+    try:
+        stats = replay.replay(
+            args.replay,
+            decoder.pkt_callback,
+            port_range=(11001, 11003),
+            realtime=args.realtime,
+            speed=args.speed,
+        )
+    except KeyboardInterrupt:
+        stop_evt.set()
+        raise
+    finally:
+        decoder.process_flow_buffer = decode
+    feed_wall = time.perf_counter() - wall0
+    wait_for_pending(stop_evt, printer_thread)
+    total_wall = time.perf_counter() - wall0
+    total_cpu = time.process_time() - cpu0
+
+    decode_stats = decoder.decode_stats
+    frames = decode_stats["decoded"] + decode_stats["skipped"]
+    reassembly_cpu = stats["pipeline_cpu"] - decode_cpu[0]
+    main_cpu = stats["parse_cpu"] + stats["pipeline_cpu"]
+
+    def rate(n):
+        return n / feed_wall if feed_wall > 0 else 0.0
+
+    print(f"replayed {args.replay} in {feed_wall:.3f}s (until last line shown: {total_wall:.3f}s)")
+    print(f"  packets   {stats['packets']:>10}  {rate(stats['packets']):12.0f}/s")
+    print(f"  segments  {stats['segments']:>10}  {rate(stats['segments']):12.0f}/s")
+    print(f"  frames    {frames:>10}  {rate(frames):12.0f}/s")
+    print(f"  chat      {decode_stats['decoded']:>10}  {rate(decode_stats['decoded']):12.0f}/s")
+    print("  cpu time per stage:")
+    print(f"    parse       {stats['parse_cpu'] * 1000:10.1f} ms")
+    print(f"    reassembly  {reassembly_cpu * 1000:10.1f} ms")
+    print(f"    decode      {decode_cpu[0] * 1000:10.1f} ms")
+    print(f"    other threads (translation, printer) {(total_cpu - main_cpu) * 1000:10.1f} ms")
+    log_stats()
+    translate.close()
+    profiling.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--replay", metavar="FILE", help="feed a .pcap/.pcapng capture instead of sniffing"
+    )
+    parser.add_argument(
+        "--realtime", action="store_true", help="replay with the original packet timing"
+    )
+    parser.add_argument(
+        "--speed", type=float, default=1.0, help="timing multiplier for --realtime"
+    )
+    parser.add_argument(
+        "--no-translate", action="store_true", help="replay without calling any backend"
+    )
+    parser.add_argument(
+        "--ui", action="store_true", help="show replayed lines in the overlay"
+    )
+    args = parser.parse_args(argv)
+    cfg = load_config()
+    if args.replay:
+        run_replay(args, cfg)
+        return
     translate.configure(cfg)
+    decoder.flow_buffers.configure(cfg.get("flows") or {})
+    decoder.chat_handler = schedule_translation
+    configure_display(cfg.get("display") or {})
+    configure_intake(cfg.get("intake") or {})
+    start_metrics(cfg.get("metrics") or {})
+    start_profiling(cfg.get("profiling") or {})
     iface = get_active_interface()
     threading.Thread(target=create_floating_window, daemon=True).start()
     if iface is None:
@@ -283,10 +575,19 @@ def main():
     stop_evt = threading.Event()
     printer_thread = threading.Thread(target=printer_loop, args=(stop_evt,))
     printer_thread.start()
+    backend = (cfg.get("capture") or {}).get("backend", "auto")
+    pipeline_cfg = cfg.get("pipeline") or {}
+    if pipeline_cfg.get("workers", 0) > 0:
+        run_pipeline(iface, backend, pipeline_cfg, cfg, stop_evt, printer_thread)
+        return
     sniff_thread = threading.Thread(
         target=start_sniffer,
         args=(iface, None, (11001, 11003), stop_evt),
-        kwargs={"bpf": None, "promisc": False},
+        kwargs={
+            "bpf": None,
+            "promisc": False,
+            "backend": backend,
+        },
     )
     sniff_thread.start()
     time.sleep(1)
@@ -301,10 +602,14 @@ def main():
         pass
     stop_evt.set()
     printer_thread.join(timeout=5)
-    executor.shutdown(wait=False)
+    log_stats()
+    translate.close()
+    profiling.stop()
 
 
 if __name__ == "__main__":
+    # frozen builds re-run this file in every spawned pipeline worker
+    multiprocessing.freeze_support()
     try:
         main()
     except Exception as e:
@@ -0,0 +1,174 @@
+import bisect
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "of_translate"
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+enabled = False
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+_gauges = {}
+_server = None
+_stop = threading.Event()
+
+
+class Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return BUCKETS[i] if i < len(BUCKETS) else float("inf")
+        return float("inf")
+
+
+def _key(name: str, labels: dict) -> tuple:
+    return (name,) + tuple(sorted(labels.items()))
+
+
+def observe(stage: str, seconds: float, **labels):
+    if not enabled:
+        return
+    key = _key(stage, labels)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = Histogram()
+        hist.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        hist.total += seconds
+        hist.count += 1
+
+
+def inc(name: str, n: int = 1, **labels):
+    if not enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + n
+
+
+def gauge(name: str, fn: Callable[[], float]):
+    _gauges[name] = fn
+
+
+def _labels(pairs) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+def render() -> str:
+    lines = [f"# TYPE {PREFIX}_stage_seconds histogram"]
+    with _lock:
+        histograms = sorted(_histograms.items())
+        counters = sorted(_counters.items())
+    for (stage, *pairs), hist in histograms:
+        pairs = [("stage", stage)] + pairs
+        seen = 0
+        for bound, n in zip(BUCKETS, hist.counts):
+            seen += n
+            lines.append(
+                f"{PREFIX}_stage_seconds_bucket{_labels(pairs + [('le', bound)])} {seen}"
+            )
+        lines.append(
+            f"{PREFIX}_stage_seconds_bucket{_labels(pairs + [('le', '+Inf')])} {hist.count}"
+        )
+        lines.append(f"{PREFIX}_stage_seconds_sum{_labels(pairs)} {hist.total:.6f}")
+        lines.append(f"{PREFIX}_stage_seconds_count{_labels(pairs)} {hist.count}")
+    for (name, *pairs), value in counters:
+        lines.append(f"{PREFIX}_{name}_total{_labels(pairs)} {value}")
+    for name, fn in sorted(_gauges.items()):
+        try:
+            lines.append(f"{PREFIX}_{name} {fn()}")
+        except Exception:
+            pass
+    return "\n".join(lines) + "\n"
+
+
+def summary() -> dict:
+    out = {}
+    with _lock:
+        for (stage, *pairs), hist in _histograms.items():
+            if not hist.count:
+                continue
+            label = stage + "".join(f"[{v}]" for _, v in pairs)
+            out[label] = {
+                "count": hist.count,
+                "mean_ms": round(hist.total / hist.count * 1000, 1),
+                "p50_le_ms": hist.quantile(0.5) * 1000,
+                "p90_le_ms": hist.quantile(0.9) * 1000,
+            }
+    return out
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _log_loop(interval: float):
+    while not _stop.wait(interval):
+        logger.info("stage latency: %s", summary())
+
+
+def start(cfg: dict):
+    global enabled, _server
+    if not cfg.get("enable"):
+        return
+    enabled = True
+    _stop.clear()
+    port = cfg.get("port", 9464)
+    if port:
+        host = cfg.get("host", "127.0.0.1")
+        try:
+            _server = ThreadingHTTPServer((host, port), _Handler)
+        except OSError as e:
+            print(f"metrics endpoint not started on {host}:{port}: {e}")
+        else:
+            _server.daemon_threads = True
+            threading.Thread(
+                target=_server.serve_forever, name="metrics", daemon=True
+            ).start()
+            print(f"metrics on http://{host}:{port}/metrics")
+    interval = cfg.get("log_interval", 0)
+    if interval:
+        threading.Thread(
+            target=_log_loop, args=(interval,), name="metrics-log", daemon=True
+        ).start()
+
+
+def stop():
+    global _server
+    _stop.set()
+    if _server is not None:
+        _server.shutdown()
+        _server.server_close()
+        _server = None
@@ -0,0 +1,96 @@
+import os
+import threading
+import unicodedata
+from typing import List, Optional
+
+PHRASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "phrases")
+
+
+def _key(text: str) -> str:
+    return unicodedata.normalize("NFKC", text).casefold()
+
+
+def _spaced(ch: str) -> bool:
+    # letters of scripts that separate words with spaces; CJK phrases may
+    # start and end anywhere
+    return ch.isalnum() and ord(ch) < 0x2E80
+
+
+class PhraseTable:
+    # Greedy longest-match phrase lookup. A line is only translated when every
+    # letter in it is covered by a phrase; anything else is left to the next
+    # backend.
+
+    def __init__(self, path: str):
+        self.path = path
+        self._phrases = None
+        self._max_len = 0
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._phrases is not None:
+                return
+            phrases = {}
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        line = line.rstrip("\n")
+                        if not line or line.startswith("#") or "\t" not in line:
+                            continue
+                        src, dst = line.split("\t", 1)
+                        src = _key(src.strip())
+                        if src and dst.strip():
+                            phrases[src] = dst.strip()
+            except OSError as e:
+                print(f"local phrase table not loaded: {e}")
+            self._max_len = max((len(k) for k in phrases), default=0)
+            self._phrases = phrases
+
+    def __len__(self):
+        self._load()
+        return len(self._phrases)
+
+    def translate(self, text: str) -> Optional[str]:
+        self._load()
+        phrases = self._phrases
+        if not phrases:
+            return None
+        s = _key(text)
+        n = len(s)
+        out = []
+        last_phrase = False
+        i = 0
+        while i < n:
+            match = None
+            if not (_spaced(s[i]) and i > 0 and _spaced(s[i - 1])):
+                for j in range(min(n, i + self._max_len), i, -1):
+                    dst = phrases.get(s[i:j])
+                    if dst is None:
+                        continue
+                    if _spaced(s[j - 1]) and j < n and _spaced(s[j]):
+                        continue
+                    match = (j, dst)
+                    break
+            if match is not None:
+                if last_phrase:
+                    out.append(" ")
+                out.append(match[1])
+                i = match[0]
+                last_phrase = True
+                continue
+            if s[i].isalpha():
+                return None
+            out.append(s[i])
+            last_phrase = False
+            i += 1
+        if not any(ch.isalpha() for ch in s):
+            return None
+        return "".join(out)
+
+    def translate_batch(self, texts: List[str]) -> List[Optional[str]]:
+        return [self.translate(t) for t in texts]
+
+
+def for_language(lang: str, directory: Optional[str] = None) -> PhraseTable:
+    return PhraseTable(os.path.join(directory or PHRASE_DIR, f"{lang}.tsv"))
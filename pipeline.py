@@ -0,0 +1,276 @@
+import logging
+import multiprocessing as mp
+import queue
+import socket
+import struct
+import threading
+import time
+import zlib
+from multiprocessing import shared_memory
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+HEADER = 64
+HEAD_OFF = 0
+CAP_OFF = 16
+TAIL_OFF = 32
+WRAP = 0xFFFFFFFF
+_u32 = struct.Struct("<I")
+_u64 = struct.Struct("<Q")
+SEGMENT = struct.Struct("<4s4sHHIBd")
+
+
+class ShmRing:
+    # Single-producer/single-consumer ring of length-prefixed records in
+    # shared memory. head and tail are free-running byte counters; each side
+    # only ever writes its own counter.
+
+    def __init__(self, capacity: int = 0, name: Optional[str] = None):
+        if name is None:
+            self._shm = shared_memory.SharedMemory(create=True, size=HEADER + capacity)
+            self._shm.buf[:HEADER] = bytes(HEADER)
+            _u64.pack_into(self._shm.buf, CAP_OFF, capacity)
+            self.owner = True
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        self.name = self._shm.name
+        self._buf = self._shm.buf
+        (self.capacity,) = _u64.unpack_from(self._buf, CAP_OFF)
+
+    def _head(self) -> int:
+        return _u64.unpack_from(self._buf, HEAD_OFF)[0]
+
+    def _tail(self) -> int:
+        return _u64.unpack_from(self._buf, TAIL_OFF)[0]
+
+    def used(self) -> int:
+        return self._head() - self._tail()
+
+    def push(self, header: bytes, payload) -> bool:
+        buf = self._buf
+        cap = self.capacity
+        n = 4 + len(header) + len(payload)
+        head = self._head()
+        free = cap - (head - self._tail())
+        idx = head % cap
+        if idx + n > cap:
+            pad = cap - idx
+            if free < pad + n:
+                return False
+            if pad >= 4:
+                _u32.pack_into(buf, HEADER + idx, WRAP)
+            head += pad
+            idx = 0
+        elif free < n:
+            return False
+        start = HEADER + idx
+        _u32.pack_into(buf, start, n - 4)
+        buf[start + 4 : start + 4 + len(header)] = header
+        buf[start + 4 + len(header) : start + n] = payload
+        _u64.pack_into(buf, HEAD_OFF, head + n)
+        return True
+
+    def pop(self) -> Optional[bytes]:
+        buf = self._buf
+        cap = self.capacity
+        tail = self._tail()
+        head = self._head()
+        while tail != head:
+            idx = tail % cap
+            if cap - idx < 4:
+                tail += cap - idx
+                continue
+            (n,) = _u32.unpack_from(buf, HEADER + idx)
+            if n == WRAP:
+                tail += cap - idx
+                continue
+            start = HEADER + idx + 4
+            rec = bytes(buf[start : start + n])
+            _u64.pack_into(buf, TAIL_OFF, tail + 4 + n)
+            return rec
+        _u64.pack_into(buf, TAIL_OFF, tail)
+        return None
+
+    def close(self):
+        self._buf = None
+        self._shm.close()
+        if self.owner:
+            try:
+                self._shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def _shard(src: bytes, dst: bytes, sport: int, dport: int, n: int) -> int:
+    a = src + sport.to_bytes(2, "big")
+    b = dst + dport.to_bytes(2, "big")
+    return zlib.crc32(a + b if a <= b else b + a) % n
+
+
+def _capture_main(
+    backend, iface, bpf_filter, ip, port_range, promisc, ring_names, stop_event, drops
+):
+    import capture
+
+    rings = [ShmRing(name=n) for n in ring_names]
+    shards = len(rings)
+    dropped = 0
+
+    def on_segment(flow_key, seq, flags, payload, now=None):
+        nonlocal dropped
+        src_ip, dst_ip, sport, dport = flow_key
+        src = socket.inet_aton(src_ip)
+        dst = socket.inet_aton(dst_ip)
+        header = SEGMENT.pack(src, dst, sport, dport, seq or 0, flags, time.time())
+        if not rings[_shard(src, dst, sport, dport, shards)].push(header, payload):
+            dropped += 1
+            if dropped % 64 == 1:
+                with drops.get_lock():
+                    drops.value = dropped
+
+    try:
+        cap = capture.open_capture(
+            backend, iface, bpf_filter, ip_filter=ip, port_range=port_range, promisc=promisc
+        )
+        capture.run_capture(cap, on_segment, stop_event)
+    finally:
+        with drops.get_lock():
+            drops.value = dropped
+        for ring in rings:
+            ring.close()
+
+
+def _decoder_main(index, ring_name, results, stop_event, flows_cfg):
+    import decoder
+
+    ring = ShmRing(name=ring_name)
+    decoder.flow_buffers.configure(flows_cfg)
+    captured_at = 0.0
+
+    def on_chat(name, text):
+        results.put(("chat", name, text, captured_at))
+
+    decoder.chat_handler = on_chat
+    idle = 0
+    try:
+        while True:
+            rec = ring.pop()
+            if rec is None:
+                if stop_event.is_set():
+                    break
+                idle += 1
+                time.sleep(0.0005 if idle < 200 else 0.005)
+                continue
+            idle = 0
+            src, dst, sport, dport, seq, flags, captured_at = SEGMENT.unpack_from(rec)
+            flow_key = (socket.inet_ntoa(src), socket.inet_ntoa(dst), sport, dport)
+            decoder.pkt_callback(
+                flow_key, seq, flags, memoryview(rec)[SEGMENT.size :]
+            )
+    finally:
+        results.put(
+            (
+                "stats",
+                index,
+                {
+                    "flows": decoder.flow_buffers.stats(),
+                    "decoder": dict(decoder.decode_stats),
+                },
+                time.time(),
+            )
+        )
+        ring.close()
+
+
+class Pipeline:
+    def __init__(
+        self,
+        workers: int,
+        ring_bytes: int,
+        backend: str,
+        iface: str,
+        bpf_filter: str,
+        ip: Optional[str],
+        port_range: Optional[Tuple[int, int]],
+        promisc: bool,
+        flows_cfg: dict,
+        on_chat,
+    ):
+        self.workers = max(1, int(workers))
+        self.ring_bytes = int(ring_bytes)
+        self._capture_args = (backend, iface, bpf_filter, ip, port_range, promisc)
+        self.flows_cfg = flows_cfg
+        self.on_chat = on_chat
+        self.worker_stats = {}
+        self._ctx = mp.get_context("spawn")
+        self._rings = []
+        self._procs = []
+        self._capture = None
+        self._reader = None
+
+    def start(self):
+        ctx = self._ctx
+        self._rings = [ShmRing(self.ring_bytes) for _ in range(self.workers)]
+        self._results = ctx.Queue()
+        self._stop = ctx.Event()
+        self._drops = ctx.Value("q", 0)
+        for i, ring in enumerate(self._rings):
+            p = ctx.Process(
+                target=_decoder_main,
+                args=(i, ring.name, self._results, self._stop, self.flows_cfg),
+                name=f"decoder-{i}",
+                daemon=True,
+            )
+            p.start()
+            self._procs.append(p)
+        self._capture = ctx.Process(
+            target=_capture_main,
+            args=self._capture_args
+            + ([r.name for r in self._rings], self._stop, self._drops),
+            name="capture",
+            daemon=True,
+        )
+        self._capture.start()
+        self._reader = threading.Thread(target=self._read_results, daemon=True)
+        self._reader.start()
+
+    def _read_results(self):
+        alive = len(self._procs)
+        while alive:
+            try:
+                item = self._results.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            if item[0] == "chat":
+                try:
+                    captured = time.monotonic() - max(0.0, time.time() - item[3])
+                    self.on_chat(item[1], item[2], captured)
+                except Exception:
+                    logger.exception("chat handler failed")
+            elif item[0] == "stats":
+                self.worker_stats[item[1]] = item[2]
+                alive -= 1
+
+    def is_alive(self) -> bool:
+        return self._capture is not None and self._capture.is_alive()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._capture is not None:
+            self._capture.join(timeout=timeout)
+        for p in self._procs:
+            p.join(timeout=timeout)
+        if self._reader is not None:
+            self._reader.join(timeout=timeout)
+        for ring in self._rings:
+            ring.close()
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "ring_drops": self._drops.value,
+            "ring_used": [r.used() for r in self._rings if r._buf is not None],
+            "per_worker": dict(self.worker_stats),
+        }
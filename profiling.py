@@ -0,0 +1,268 @@
+import cProfile
+import io
+import os
+import pstats
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Callable
+
+# Hot paths call checkpoint() only while this is True, so profiling costs a
+# single global lookup per packet/line when it is off.
+active = False
+
+_mode = "sampling"
+_dir = "profiles"
+_interval = 0.005
+_top = 30
+_lock = threading.Lock()
+_running = False
+_generation = 0
+_started = 0
+_collected = []
+_samples = Counter()
+_sampler = None
+_began = 0.0
+_local = threading.local()
+# From 3.12 cProfile sits on sys.monitoring: a single profiler sees every
+# thread and a second one cannot be enabled while it runs.
+_process_wide = sys.version_info >= (3, 12)
+_shared = None
+_trackers = {}
+_last_snapshot = None
+_tracing_started = False
+
+
+def configure(cfg: dict):
+    global _mode, _dir, _interval, _top
+    _mode = cfg.get("mode", _mode)
+    _dir = cfg.get("dir", _dir)
+    _interval = cfg.get("sample_interval_ms", _interval * 1000) / 1000.0
+    _top = cfg.get("top", _top)
+    if cfg.get("signals", True):
+        _install_signals()
+    if cfg.get("enable"):
+        start()
+        duration = cfg.get("duration", 0)
+        if duration:
+            timer = threading.Timer(duration, stop)
+            timer.daemon = True
+            timer.start()
+
+
+def track(name: str, fn: Callable[[], object]):
+    _trackers[name] = fn
+
+
+def _install_signals():
+    if threading.current_thread() is not threading.main_thread():
+        return
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, lambda *_: toggle())
+    if hasattr(signal, "SIGUSR2"):
+        signal.signal(signal.SIGUSR2, lambda *_: snapshot())
+
+
+def _path(kind: str, ext: str) -> str:
+    os.makedirs(_dir, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    return os.path.join(_dir, f"{kind}-{stamp}.{ext}")
+
+
+def toggle():
+    if _running:
+        stop()
+    else:
+        start()
+
+
+def start():
+    global active, _running, _generation, _started, _sampler, _began, _shared
+    with _lock:
+        if _running:
+            return
+        _running = True
+        _generation += 1
+        _started = 0
+        _collected.clear()
+        _samples.clear()
+        _began = time.monotonic()
+        if _mode == "cprofile" and _process_wide:
+            prof = cProfile.Profile()
+            try:
+                prof.enable()
+            except ValueError as e:
+                _running = False
+                print(f"profiling not started: {e}")
+                return
+            _shared = prof
+        elif _mode == "cprofile":
+            active = True
+        else:
+            _sampler = threading.Thread(target=_sample_loop, name="profiler", daemon=True)
+            _sampler.start()
+    print(f"profiling started ({_mode})")
+
+
+def stop():
+    global active, _running, _sampler, _shared
+    with _lock:
+        if not _running:
+            return
+        _running = False
+        sampler, _sampler = _sampler, None
+        shared, _shared = _shared, None
+    if sampler is not None:
+        sampler.join(timeout=2)
+        path = _dump_samples()
+    elif shared is not None:
+        shared.disable()
+        path = _dump_profiles([shared])
+    else:
+        # each profiled thread hands its profiler back at its next checkpoint
+        deadline = time.monotonic() + 2.0
+        while time.monotonic() < deadline:
+            with _lock:
+                if len(_collected) >= _started:
+                    break
+            time.sleep(0.05)
+        with _lock:
+            profiles = list(_collected)
+            if len(_collected) >= _started:
+                active = False
+        path = _dump_profiles(profiles)
+    print(f"profiling stopped, results in {path}")
+
+
+def checkpoint():
+    prof = getattr(_local, "prof", None)
+    if prof is None:
+        if _running and _mode == "cprofile":
+            global _started
+            prof = cProfile.Profile()
+            try:
+                prof.enable()
+            except ValueError:
+                # another profiler owns this interpreter; leave the thread out
+                return
+            _local.prof = prof
+            _local.gen = _generation
+            with _lock:
+                _started += 1
+        return
+    if _running and _local.gen == _generation:
+        return
+    prof.disable()
+    _local.prof = None
+    global active
+    with _lock:
+        if _local.gen == _generation:
+            _collected.append(prof)
+        if not _running and len(_collected) >= _started:
+            active = False
+
+
+def _dump_profiles(profiles: list) -> str:
+    if not profiles:
+        return "(no profiled thread reached a checkpoint)"
+    path = _path("profile", "prof")
+    stats = pstats.Stats(profiles[0])
+    for prof in profiles[1:]:
+        stats.add(prof)
+    stats.dump_stats(path)
+    out = io.StringIO()
+    pstats.Stats(path, stream=out).sort_stats("cumulative").print_stats(_top)
+    with open(path[: -len(".prof")] + ".txt", "w", encoding="utf-8") as f:
+        f.write(out.getvalue())
+    return path
+
+
+def _sample_loop():
+    me = threading.get_ident()
+    while _running:
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            stack = []
+            while frame is not None and len(stack) < 64:
+                code = frame.f_code
+                stack.append(
+                    f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                )
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            _samples[tuple(reversed(stack))] += 1
+        time.sleep(_interval)
+
+
+def _dump_samples() -> str:
+    samples = dict(_samples)
+    total = sum(samples.values())
+    path = _path("profile", "collapsed")
+    with open(path, "w", encoding="utf-8") as f:
+        for stack, n in sorted(samples.items(), key=lambda kv: -kv[1]):
+            f.write(";".join(stack) + f" {n}\n")
+    own = Counter()
+    inclusive = Counter()
+    for stack, n in samples.items():
+        own[stack[-1]] += n
+        for fn in set(stack[1:]):
+            inclusive[fn] += n
+    lines = [
+        f"{total} samples over {time.monotonic() - _began:.1f}s "
+        f"every {_interval * 1000:.1f} ms",
+        "",
+        "self:",
+    ]
+    lines += [f"{n / total:7.1%}  {fn}" for fn, n in own.most_common(_top)] if total else []
+    lines += ["", "inclusive:"]
+    lines += [f"{n / total:7.1%}  {fn}" for fn, n in inclusive.most_common(_top)] if total else []
+    with open(path[: -len(".collapsed")] + ".txt", "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    return path
+
+
+def snapshot() -> str:
+    # The first call starts tracing and records a baseline; the next one writes
+    # the growth since then and stops tracing again, so allocations only pay
+    # for it between the two.
+    global _last_snapshot, _tracing_started
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(10)
+        _tracing_started = True
+        _last_snapshot = None
+    snap = tracemalloc.take_snapshot().filter_traces(
+        (
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        )
+    )
+    lines = [f"traced: {tracemalloc.get_traced_memory()[0]} bytes"]
+    for name, fn in _trackers.items():
+        try:
+            lines.append(f"{name}: {fn()}")
+        except Exception as e:
+            lines.append(f"{name}: error {e}")
+    lines.append("")
+    if _last_snapshot is None:
+        lines.append("baseline (tracing started now, take another snapshot for a diff)")
+        lines += [str(s) for s in snap.statistics("lineno")[:_top]]
+        _last_snapshot = snap
+    else:
+        lines.append("growth since previous snapshot:")
+        lines += [str(s) for s in snap.compare_to(_last_snapshot, "lineno")[:_top]]
+        if _tracing_started:
+            tracemalloc.stop()
+            _tracing_started = False
+            _last_snapshot = None
+        else:
+            _last_snapshot = snap
+    path = _path("memory", "txt")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    print(f"memory snapshot written to {path}")
+    return path
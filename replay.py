@@ -0,0 +1,155 @@
+import struct
+import time
+from typing import Iterator, Optional, Tuple
+
+import capture
+
+PCAP_MAGIC_US = 0xA1B2C3D4
+PCAP_MAGIC_NS = 0xA1B23C4D
+PCAPNG_SHB = 0x0A0D0D0A
+PCAPNG_BOM = 0x1A2B3C4D
+PCAPNG_IDB = 1
+PCAPNG_SPB = 3
+PCAPNG_EPB = 6
+
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_LINUX_SLL2 = 276
+
+Packet = Tuple[float, int, memoryview]
+
+
+def _read_pcap(mv: memoryview) -> Iterator[Packet]:
+    (magic,) = struct.unpack_from("<I", mv, 0)
+    if magic in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+        endian = "<"
+    else:
+        endian = ">"
+        (magic,) = struct.unpack_from(">I", mv, 0)
+    scale = 1e-9 if magic == PCAP_MAGIC_NS else 1e-6
+    (linktype,) = struct.unpack_from(endian + "I", mv, 20)
+    linktype &= 0xFFFF
+    rec = struct.Struct(endian + "IIII")
+    off = 24
+    end = len(mv)
+    while off + 16 <= end:
+        sec, frac, incl_len, _ = rec.unpack_from(mv, off)
+        off += 16
+        if off + incl_len > end:
+            break
+        yield sec + frac * scale, linktype, mv[off : off + incl_len]
+        off += incl_len
+
+
+def _tsresol(options: memoryview, endian: str) -> float:
+    off = 0
+    while off + 4 <= len(options):
+        code, length = struct.unpack_from(endian + "HH", options, off)
+        if code == 0:
+            break
+        if code == 9 and length >= 1:
+            v = options[off + 4]
+            return 2.0 ** -(v & 0x7F) if v & 0x80 else 10.0**-v
+        off += 4 + ((length + 3) & ~3)
+    return 1e-6
+
+
+def _read_pcapng(mv: memoryview) -> Iterator[Packet]:
+    endian = "<"
+    interfaces = []
+    off = 0
+    end = len(mv)
+    while off + 12 <= end:
+        (btype,) = struct.unpack_from(endian + "I", mv, off)
+        if btype == PCAPNG_SHB:
+            (bom,) = struct.unpack_from("<I", mv, off + 8)
+            endian = "<" if bom == PCAPNG_BOM else ">"
+            interfaces = []
+        (blen,) = struct.unpack_from(endian + "I", mv, off + 4)
+        if blen < 12 or off + blen > end:
+            break
+        body = mv[off + 8 : off + blen - 4]
+        if btype == PCAPNG_IDB:
+            (linktype,) = struct.unpack_from(endian + "H", body, 0)
+            interfaces.append((linktype, _tsresol(body[8:], endian)))
+        elif btype == PCAPNG_EPB:
+            if_id, ts_hi, ts_lo, caplen, _ = struct.unpack_from(endian + "IIIII", body, 0)
+            if if_id < len(interfaces):
+                linktype, resol = interfaces[if_id]
+                yield ((ts_hi << 32) | ts_lo) * resol, linktype, body[20 : 20 + caplen]
+        elif btype == PCAPNG_SPB and interfaces:
+            linktype, _ = interfaces[0]
+            yield 0.0, linktype, body[4:]
+        off += blen
+
+
+def read_packets(path: str) -> Iterator[Packet]:
+    with open(path, "rb") as f:
+        data = f.read()
+    mv = memoryview(data)
+    if len(mv) < 24:
+        return
+    (magic,) = struct.unpack_from("<I", mv, 0)
+    if magic == PCAPNG_SHB:
+        yield from _read_pcapng(mv)
+    else:
+        yield from _read_pcap(mv)
+
+
+def parse_link(
+    linktype: int,
+    frame: memoryview,
+    ip_filter: Optional[str] = None,
+    port_range: Optional[Tuple[int, int]] = None,
+):
+    if linktype == LINKTYPE_ETHERNET:
+        return capture.parse_ethernet(frame, ip_filter, port_range)
+    if linktype in (LINKTYPE_RAW, LINKTYPE_IPV4):
+        return capture.parse_ipv4(frame, 0, ip_filter, port_range)
+    if linktype == LINKTYPE_LINUX_SLL:
+        if len(frame) >= 16 and (frame[14] << 8 | frame[15]) == capture.ETH_P_IP:
+            return capture.parse_ipv4(frame, 16, ip_filter, port_range)
+        return None
+    if linktype == LINKTYPE_LINUX_SLL2:
+        if len(frame) >= 20 and (frame[0] << 8 | frame[1]) == capture.ETH_P_IP:
+            return capture.parse_ipv4(frame, 20, ip_filter, port_range)
+        return None
+    if linktype == LINKTYPE_NULL:
+        return capture.parse_ipv4(frame, 4, ip_filter, port_range)
+    return None
+
+
+def replay(
+    path: str,
+    on_segment,
+    port_range: Optional[Tuple[int, int]] = None,
+    realtime: bool = False,
+    speed: float = 1.0,
+    stop_event=None,
+) -> dict:
+    stats = {"packets": 0, "segments": 0, "parse_cpu": 0.0, "pipeline_cpu": 0.0}
+    first_ts = None
+    start = time.monotonic()
+    for ts, linktype, frame in read_packets(path):
+        if stop_event is not None and stop_event.is_set():
+            break
+        stats["packets"] += 1
+        if realtime:
+            if first_ts is None:
+                first_ts = ts
+            delay = (ts - first_ts) / speed - (time.monotonic() - start)
+            if delay > 0:
+                time.sleep(delay)
+        t0 = time.thread_time()
+        seg = parse_link(linktype, frame, port_range=port_range)
+        t1 = time.thread_time()
+        stats["parse_cpu"] += t1 - t0
+        if seg is None:
+            continue
+        stats["segments"] += 1
+        on_segment(*seg, now=ts)
+        stats["pipeline_cpu"] += time.thread_time() - t1
+    return stats
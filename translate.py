@@ -1,61 +1,507 @@
-import requests
 import asyncio
-from concurrent.futures import ThreadPoolExecutor, TimeoutError
-from typing import Optional
+import functools
+from concurrent.futures import Future, InvalidStateError
+from typing import Callable, Optional
+import inspect
+import json
+import os
+import threading
+import time
 import traceback
+from collections import deque
+from email.utils import parsedate_to_datetime
+import httpx
 from googletrans import Translator
+from cache import TranslationCache, normalize
+import backends
+import detect
+import phrasebook
+import glossary
+import metrics
+import profiling
 
 _cfg = {}
-OPENAI_API_URL = None
-API_KEY = None
-DEFAULT_MODEL = None
 TARGET_LANG = "en"
 TRANSLATION_TIMEOUT = 10
-_executor = ThreadPoolExecutor(max_workers=4)
 _services = []
+_cache = None
+_engine = None
+_hedge = {}
+_hedge_stats = {"hedges": 0, "wins": 0, "cancelled": 0}
+_latency = {}
+_detect = True
+_skip_stats = {"checked": 0, "target_lang": 0, "no_letters": 0}
+_inflight = {}
+_inflight_lock = threading.Lock()
+_flight_stats = {"calls": 0, "coalesced": 0}
+_rate_stats = {}
+_health = {}
+_glossary = None
+_glossary_stats = {"protected": 0, "terms": 0, "answered_locally": 0}
+_breaker = {}
+_burst = 8
+_active = 0
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
 
 
 def configure(cfg: dict):
-    global _cfg, OPENAI_API_URL, API_KEY, DEFAULT_MODEL, TARGET_LANG, TRANSLATION_TIMEOUT, _services
+    global _cfg, TARGET_LANG, TRANSLATION_TIMEOUT, _services, _cache, _engine, _hedge, _detect, _breaker, _glossary, _burst
     _cfg = cfg
     TARGET_LANG = cfg.get("TARGET_LANG", TARGET_LANG)
     TRANSLATION_TIMEOUT = cfg.get("TRANSLATION_TIMEOUT", TRANSLATION_TIMEOUT)
 
+    backends_cfg = cfg.get("backends") or {}
+    backends.load_modules(backends_cfg.get("modules") or [])
+    backends.load_entry_points()
     services = []
-    if cfg == {} or cfg.get("google").get("enable"):
-        services.append({"name": "google", "timeout": cfg.get("timeout", 5)})
-    if cfg.get("openai") and cfg.get("openai").get("enable"):
-        OPENAI_API_URL = cfg.get("openai").get("api_url")
-        API_KEY = cfg.get("openai").get("api_key")
-        DEFAULT_MODEL = cfg.get("openai").get("model", "gpt-4.1-nano")
-        services.append({"name": "openai", "timeout": cfg.get("timeout", 8)})
-    if cfg.get("external") and cfg.get("external").get("enable"):
-        svc = cfg.get("external")
-        services.append(
-            {"name": "external", "url": svc["url"], "timeout": svc.get("timeout", 6)}
-        )
+    for name, cls in backends.registered().items():
+        svc_cfg = cfg.get(name) or {}
+        if not (svc_cfg.get("enable") or (name == "google" and cfg == {})):
+            continue
+        try:
+            svc = cls(svc_cfg)
+        except Exception as e:
+            print(f"backend {name} not started: {e}")
+            continue
+        if not svc.supports(TARGET_LANG):
+            print(f"backend {name} skipped: no {TARGET_LANG} support")
+            continue
+        services.append(svc)
 
-    services.sort(key=lambda s: 0 if s.get("name") == "google" else 1)
     _services = services
+    _burst = backends_cfg.get("burst_inflight", 8)
+    _breaker = cfg.get("breaker") or {}
+    for svc in services:
+        health = _health.get(svc.name)
+        if health is None:
+            _health[svc.name] = _Health(svc.name)
+        else:
+            health.reset()
+    _hedge = cfg.get("hedge") or {}
+    _detect = (cfg.get("detect") or {}).get("enable", True)
+    glossary_cfg = cfg.get("glossary") or {}
+    _glossary = None
+    if glossary_cfg.get("enable"):
+        _glossary = glossary.Glossary(glossary.load_terms(glossary_cfg))
+        print(f"glossary: {len(_glossary)} terms")
+
+    if _engine is not None:
+        _engine.close()
+    _engine = _Engine(services)
+
+    cache_cfg = cfg.get("cache") or {}
+    if _cache is not None:
+        _cache.close()
+        _cache = None
+    if cache_cfg.get("enable", True):
+        path = cache_cfg.get("path", "~/.of-translate-cache.db")
+        _cache = TranslationCache(
+            path=os.path.expanduser(path) if path else None,
+            memory_entries=cache_cfg.get("memory_entries", 4096),
+            disk_entries=cache_cfg.get("disk_entries", 200000),
+            ttl=cache_cfg.get("ttl", 7 * 24 * 3600),
+        )
+
+
+def cache_stats() -> dict:
+    return _cache.stats() if _cache is not None else {}
+
+
+def hedge_stats() -> dict:
+    return dict(_hedge_stats)
+
+
+def skip_stats() -> dict:
+    stats = dict(_skip_stats)
+    checked = stats["checked"] or 1
+    stats["skip_rate"] = round((stats["target_lang"] + stats["no_letters"]) / checked, 3)
+    return stats
+
+
+def glossary_stats() -> dict:
+    return dict(_glossary_stats)
+
+
+def health_stats() -> dict:
+    now = time.monotonic()
+    return {name: health.stats(now) for name, health in _health.items()}
+
+
+def rate_stats() -> dict:
+    return {name: dict(stats) for name, stats in _rate_stats.items()}
+
+
+def inflight_stats() -> dict:
+    with _inflight_lock:
+        return dict(_flight_stats, inflight=len(_inflight))
+
+
+def close():
+    global _cache, _engine
+    if _engine is not None:
+        _engine.close()
+        _engine = None
+    if _cache is not None:
+        _cache.close()
+        _cache = None
+
+
+class _Health:
+    # Rolling window of (time, kind, elapsed) outcomes per backend, kind being
+    # "ok", "fail" or "lost" (censored: cancelled by a faster hedge), plus a
+    # closed -> open -> half_open circuit breaker.
+
+    def __init__(self, name: str):
+        self.name = name
+        self.samples = deque(maxlen=256)
+        self.opens = 0
+        self.reset()
+
+    def reset(self):
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.cooldown = _breaker.get("open_seconds", 10)
+        self.probing = False
+
+    def _window(self, now: float) -> list:
+        horizon = now - _breaker.get("window_seconds", 300)
+        while self.samples and self.samples[0][0] < horizon:
+            self.samples.popleft()
+        return list(self.samples)
+
+    def available(self, now: float) -> bool:
+        return self.state != "open" or now - self.opened_at >= self.cooldown
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.cooldown:
+                return False
+            self.state = "half_open"
+        if self.probing:
+            return False
+        self.probing = True
+        return True
+
+    def release(self):
+        self.probing = False
+
+    def success(self, elapsed: float):
+        self.samples.append((time.monotonic(), "ok", elapsed))
+        self.failures = 0
+        self.probing = False
+        if self.state != "closed":
+            self.state = "closed"
+            self.cooldown = _breaker.get("open_seconds", 10)
+
+    def lost(self, elapsed: float):
+        # cancelled after a faster backend answered: neither an answer nor a
+        # failure, only a lower bound on latency; leaves the breaker alone
+        self.samples.append((time.monotonic(), "lost", elapsed))
+        self.probing = False
+
+    def failure(self):
+        now = time.monotonic()
+        self.samples.append((now, "fail", 0.0))
+        self.failures += 1
+        self.probing = False
+        if self.state == "half_open":
+            self.cooldown = min(self.cooldown * 2, _breaker.get("max_open_seconds", 120))
+            self._open(now)
+        elif self.state == "closed" and self.failures >= _breaker.get("failure_threshold", 5):
+            self._open(now)
+
+    def _open(self, now: float):
+        self.state = "open"
+        self.opened_at = now
+        self.opens += 1
+        print(f"{self.name}: circuit open for {self.cooldown}s after {self.failures} failures")
+
+    def expected_cost(self, now: float, timeout: float) -> float:
+        # Backends with too few or stale samples sort first so they get
+        # measured again; otherwise expected seconds to an answer, counting
+        # a failure as a full timeout. Censored samples count as latency
+        # lower bounds but not towards the success rate.
+        samples = self._window(now)
+        if len(samples) < _breaker.get("min_samples", 5):
+            return 0.0
+        if now - samples[-1][0] > _breaker.get("remeasure_seconds", 30):
+            return 0.0
+        times = sorted(e for _, kind, e in samples if kind != "fail")
+        if not times:
+            return float(timeout)
+        answered = sum(1 for _, kind, _ in samples if kind == "ok")
+        failed = len(samples) - len(times)
+        rate = answered / (answered + failed) if answered + failed else 1.0
+        return rate * times[len(times) // 2] + (1 - rate) * timeout
+
+    def stats(self, now: float) -> dict:
+        samples = self._window(now)
+        lost = sum(1 for _, kind, _ in samples if kind == "lost")
+        samples = [s for s in samples if s[1] != "lost"]
+        ok = sorted(e for _, kind, e in samples if kind == "ok")
+        histogram = {f"le_{int(b * 1000)}ms": 0 for b in LATENCY_BUCKETS}
+        histogram["slower"] = 0
+        for e in ok:
+            for b in LATENCY_BUCKETS:
+                if e <= b:
+                    histogram[f"le_{int(b * 1000)}ms"] += 1
+                    break
+            else:
+                histogram["slower"] += 1
+        return {
+            "state": self.state,
+            "requests": len(samples),
+            "error_rate": round(1 - len(ok) / len(samples), 3) if samples else 0.0,
+            "p50_ms": round(ok[len(ok) // 2] * 1000, 1) if ok else None,
+            "p90_ms": round(ok[int(len(ok) * 0.9)] * 1000, 1) if ok else None,
+            "lost": lost,
+            "histogram": histogram,
+            "opens": self.opens,
+        }
+
+
+class _TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.stamp = time.monotonic()
+        self.blocked_until = 0.0
+
+    def blocked(self) -> bool:
+        return time.monotonic() < self.blocked_until
+
+    def retry_after(self, seconds: float):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+    async def acquire(self, max_wait: float = float("inf")) -> bool:
+        # False, without waiting any longer, once the next token is further
+        # away than max_wait
+        while True:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                delay = self.blocked_until - now
+            elif self.rate <= 0:
+                return True
+            else:
+                self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+                self.stamp = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                delay = (1 - self.tokens) / self.rate
+            if delay > max_wait:
+                return False
+            await asyncio.sleep(delay)
+            max_wait -= delay
+
+
+def _connection_broken(e: Exception) -> bool:
+    return isinstance(e, httpx.TransportError) or (
+        isinstance(e, RuntimeError) and "closed" in str(e)
+    )
+
+
+async def _close_translator(translator):
+    exit_ = getattr(translator, "__aexit__", None)
+    if exit_ is not None:
+        try:
+            await exit_(None, None, None)
+        except Exception:
+            pass
+
+
+class _Engine:
+    def __init__(self, services: list):
+        self.loop = asyncio.new_event_loop()
+        self.services = services
+        self._limits = {}
+        self._buckets = {}
+        self._clients = {}
+        self._translator = None
+        self._translator_lock = asyncio.Lock()
+        self._translator_users = {}
+        self.batchers = {}
+        for svc in services:
+            self._limits[svc.name] = asyncio.Semaphore(svc.concurrency)
+            self._buckets[svc.name] = _TokenBucket(
+                svc.cfg.get("rate_per_second", 0), svc.cfg.get("rate_burst", 5)
+            )
+            _rate_stats.setdefault(
+                svc.name, {"throttled": 0, "skipped": 0, "waited_s": 0.0}
+            )
+            if svc.batch:
+                self.batchers[svc.name] = _Batcher(self, svc)
+        self._pool_sizes = {s.name: s.cfg.get("pool_size", 8) for s in services}
+        self._thread = threading.Thread(
+            target=self._run, name="translate-engine", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro) -> Future:
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def limit(self, name: str) -> asyncio.Semaphore:
+        sem = self._limits.get(name)
+        if sem is None:
+            sem = self._limits[name] = asyncio.Semaphore(4)
+        return sem
+
+    def bucket(self, name: str) -> _TokenBucket:
+        bucket = self._buckets.get(name)
+        if bucket is None:
+            bucket = self._buckets[name] = _TokenBucket(0, 1)
+        return bucket
+
+    async def throttle(self, name: str, max_wait: float = float("inf")) -> bool:
+        start = time.monotonic()
+        try:
+            return await self.bucket(name).acquire(max_wait)
+        finally:
+            waited = time.monotonic() - start
+            if waited >= 0.001 and name in _rate_stats:
+                _rate_stats[name]["waited_s"] = round(_rate_stats[name]["waited_s"] + waited, 3)
+
+    def client(self, name: str) -> httpx.AsyncClient:
+        client = self._clients.get(name)
+        if client is None:
+            pool_size = self._pool_sizes.get(name, 8)
+            client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=pool_size, max_keepalive_connections=pool_size
+                )
+            )
+            self._clients[name] = client
+        return client
+
+    async def google(self, text: str, dest: str) -> Optional[str]:
+        async with self._translator_lock:
+            if self._translator is None:
+                translator = Translator()
+                enter = getattr(translator, "__aenter__", None)
+                if enter is not None:
+                    translator = await enter() or translator
+                self._translator = translator
+                self._translator_users[translator] = 0
+            translator = self._translator
+            self._translator_users[translator] += 1
+        try:
+            if inspect.iscoroutinefunction(translator.translate):
+                result = await translator.translate(text, dest=dest)
+            else:
+                # older googletrans builds block; keep them off the loop
+                result = await self.loop.run_in_executor(
+                    None, functools.partial(translator.translate, text, dest=dest)
+                )
+            if inspect.isawaitable(result):
+                result = await result
+        except Exception as e:
+            # Only a broken connection retires the shared client; a failed
+            # request leaves it to the others still using it.
+            if _connection_broken(e) and self._translator is translator:
+                self._translator = None
+            raise
+        finally:
+            self._translator_users[translator] -= 1
+            if self._translator_users[translator] == 0 and self._translator is not translator:
+                del self._translator_users[translator]
+                await _close_translator(translator)
+        return getattr(result, "text", str(result))
+
+    async def _aclose(self):
+        tasks = [
+            t for t in asyncio.all_tasks(self.loop) if t is not asyncio.current_task()
+        ]
+        for t in tasks:
+            t.cancel()
+        # let cancelled requests unwind, closing their streams while the
+        # clients still work, then close any generator left suspended
+        if tasks:
+            await asyncio.wait(tasks, timeout=1)
+        await self.loop.shutdown_asyncgens()
+        translator, self._translator = self._translator, None
+        if translator is not None:
+            await _close_translator(translator)
+        for svc in self.services:
+            try:
+                await svc.aclose()
+            except Exception:
+                pass
+        for client in self._clients.values():
+            try:
+                await client.aclose()
+            except Exception:
+                pass
+        self._clients.clear()
+
+    def close(self):
+        try:
+            self.submit(self._aclose()).result(timeout=2)
+        except Exception:
+            pass
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=2)
 
 
-def _openai_translate(text: str, timeout: int) -> Optional[str]:
-    if not OPENAI_API_URL or not API_KEY:
-        print("Error: OPENAI_API_URL or API_KEY is not set.")
+SYSTEM_PROMPT = (
+    "You are a professional translator. Detect the input language automatically and translate the text accurately."
+    " Copy placeholders such as ⟦0⟧ through unchanged."
+)
+BATCH_SYSTEM_PROMPT = (
+    SYSTEM_PROMPT
+    + " The input is a JSON array of independent chat messages. Reply with only a JSON array"
+    " of the same length containing the translation of each message in the same order."
+)
+
+
+def _retry_after_seconds(value: Optional[str]) -> Optional[float]:
+    if not value:
         return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _honor_retry_after(name: str, resp: httpx.Response):
+    if resp.status_code not in (429, 503):
+        return
+    delay = _retry_after_seconds(resp.headers.get("Retry-After"))
+    if delay is None:
+        if resp.status_code != 429:
+            return
+        delay = 1.0
+    _engine.bucket(name).retry_after(delay)
+    if name in _rate_stats:
+        _rate_stats[name]["throttled"] += 1
+
+
+async def _run(fn, *args):
+    # backends may implement a call as a coroutine or as a plain blocking function
+    if inspect.iscoroutinefunction(fn):
+        return await fn(*args)
+    return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
 
+def _openai_request(svc: "_OpenAIBackend", system_prompt: str, user_content: str):
     headers = {
-        "Authorization": f"Bearer {API_KEY}",
+        "Authorization": f"Bearer {svc.api_key}",
         "Content-Type": "application/json",
     }
-    system_prompt = "You are a professional translator. Detect the input language automatically and translate the text accurately."
-    user_content = (
-        f"Please translate the following text to {TARGET_LANG}. "
-        "Only return the translated text (do not add explanations):\n\n"
-        f"{text}"
-    )
     payload = {
-        "model": DEFAULT_MODEL,
+        "model": svc.model,
         "messages": [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_content},
@@ -63,17 +509,28 @@ def _openai_translate(text: str, timeout: int) -> Optional[str]:
         "temperature": 0.0,
         "max_tokens": 2000,
     }
+    return headers, payload
+
 
+async def _openai_chat(
+    svc: "_OpenAIBackend", system_prompt: str, user_content: str
+) -> Optional[str]:
+    if not svc.api_url or not svc.api_key:
+        print("Error: openai api_url or api_key is not set.")
+        return None
+
+    headers, payload = _openai_request(svc, system_prompt, user_content)
     try:
-        resp = requests.post(
-            OPENAI_API_URL, headers=headers, json=payload, timeout=timeout
+        resp = await _engine.client(svc.name).post(
+            svc.api_url, headers=headers, json=payload, timeout=svc.timeout
         )
         resp.raise_for_status()
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         print("Request/HTTP error when calling OpenAI API:", e)
         try:
             resp_obj = getattr(e, "response", None)
             if resp_obj is not None:
+                _honor_retry_after(svc.name, resp_obj)
                 print("Response status:", resp_obj.status_code)
                 print("Response body:", resp_obj.text)
         except Exception:
@@ -119,45 +576,173 @@ def _openai_translate(text: str, timeout: int) -> Optional[str]:
     return None
 
 
-async def _async_translate(text, dest):
-    async with Translator() as translator:
-        result = await translator.translate(text, dest=dest)
-        return getattr(result, "text", str(result))
+def _openai_prompt(text: str, target: str) -> str:
+    return (
+        f"Please translate the following text to {target}. "
+        "Only return the translated text (do not add explanations):\n\n"
+        f"{text}"
+    )
 
 
-def _google_translate(text: str, timeout: int) -> Optional[str]:
-    def worker():
-        try:
-            try:
-                return asyncio.run(_async_translate(text, TARGET_LANG))
-            except RuntimeError:
-                loop = asyncio.new_event_loop()
-                try:
-                    asyncio.set_event_loop(loop)
-                    return loop.run_until_complete(_async_translate(text, TARGET_LANG))
-                finally:
-                    loop.close()
-        except Exception:
+async def _openai_translate(svc: "_OpenAIBackend", text: str, target: str) -> Optional[str]:
+    return await _openai_chat(svc, SYSTEM_PROMPT, _openai_prompt(text, target))
+
+
+async def _openai_stream(svc: "_OpenAIBackend", text: str, target: str):
+    # chat completions with "stream": true answer with server-sent events,
+    # one "data: {json}" line per token delta and "data: [DONE]" at the end
+    if not svc.api_url or not svc.api_key:
+        print("Error: openai api_url or api_key is not set.")
+        return
+    headers, payload = _openai_request(svc, SYSTEM_PROMPT, _openai_prompt(text, target))
+    payload["stream"] = True
+    so_far = ""
+    try:
+        async with _engine.client(svc.name).stream(
+            "POST", svc.api_url, headers=headers, json=payload, timeout=svc.timeout
+        ) as resp:
+            if resp.status_code >= 400:
+                _honor_retry_after(svc.name, resp)
+                await resp.aread()
+                print("OpenAI stream error:", resp.status_code, resp.text)
+                return
+            lines = resp.aiter_lines()
             try:
-                from googletrans import Translator as SyncTranslator
+                async for line in lines:
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    try:
+                        chunk = json.loads(data)
+                    except ValueError:
+                        continue
+                    for choice in chunk.get("choices") or []:
+                        delta = (choice.get("delta") or {}).get("content")
+                        if delta:
+                            so_far += delta
+                    if so_far.strip():
+                        yield so_far.strip()
+            finally:
+                await lines.aclose()
+    except httpx.HTTPError as e:
+        # a cut-off stream is a failure, not a short translation
+        print("Request/HTTP error when streaming from OpenAI API:", e)
+        raise
 
-                sync_trans = SyncTranslator()
-                res = sync_trans.translate(text, dest=TARGET_LANG)
-                return getattr(res, "text", str(res))
-            except Exception:
-                return None
 
-    future = _executor.submit(worker)
+def _parse_batch_reply(reply: Optional[str], count: int) -> Optional[list]:
+    if not reply:
+        return None
+    reply = reply.strip()
+    if reply.startswith("```"):
+        reply = reply.strip("`")
+        if reply.startswith("json"):
+            reply = reply[4:]
     try:
-        return future.result(timeout=timeout)
-    except Exception:
+        data = json.loads(reply)
+    except ValueError:
+        return None
+    if isinstance(data, dict):
+        data = data.get("translations")
+    if not isinstance(data, list) or len(data) != count:
         return None
+    if not all(isinstance(t, str) for t in data):
+        return None
+    return [t.strip() for t in data]
+
+
+async def _openai_translate_batch(
+    svc: "_OpenAIBackend", texts: list, target: str
+) -> Optional[list]:
+    user_content = f"Translate each message to {target}:\n" + json.dumps(
+        texts, ensure_ascii=False
+    )
+    reply = await _openai_chat(svc, BATCH_SYSTEM_PROMPT, user_content)
+    return _parse_batch_reply(reply, len(texts))
+
+
+class _Batcher:
+    # Lines for a batch-capable backend that arrive within batch_wait_ms of
+    # each other go out as one translate_batch call.
+
+    def __init__(self, engine: _Engine, svc: backends.Backend):
+        self.engine = engine
+        self.svc = svc
+        self.max_size = svc.batch_size
+        self.max_wait = max(0.0, svc.batch_wait_ms / 1000.0)
+        self._queue = []
+        self._timer = None
+        self.batches = 0
+        self.fallbacks = 0
+
+    async def translate(self, text: str) -> Optional[str]:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.append((text, future))
+        if len(self._queue) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch = self._queue[: self.max_size]
+        del self._queue[: self.max_size]
+        if self._queue:
+            self._timer = asyncio.get_running_loop().call_later(
+                self.max_wait, self._flush
+            )
+        if batch:
+            asyncio.ensure_future(self._send(batch))
+
+    async def _send(self, batch: list):
+        batch = [(t, f) for t, f in batch if not f.done()]
+        if not batch:
+            return
+        name = self.svc.name
+        results = None
+        if len(batch) > 1:
+            self.batches += 1
+            try:
+                async with self.engine.limit(name):
+                    results = await asyncio.wait_for(
+                        _run(self.svc.translate_batch, [t for t, _ in batch], TARGET_LANG),
+                        self.svc.timeout,
+                    )
+            except Exception:
+                traceback.print_exc()
+            if results is not None and len(results) != len(batch):
+                results = None
+            if results is None:
+                self.fallbacks += 1
+                print(f"{name} batch of {len(batch)} malformed, retrying singly")
+        if results is None:
+            for text, future in batch:
+                asyncio.ensure_future(self._single(text, future))
+            return
+        for (_, future), res in zip(batch, results):
+            if not future.done():
+                future.set_result(res)
+
+    async def _single(self, text: str, future: asyncio.Future):
+        try:
+            async with self.engine.limit(self.svc.name):
+                res = await _run(self.svc.translate, text, TARGET_LANG)
+        except Exception:
+            res = None
+        if not future.done():
+            future.set_result(res)
 
 
-def _external_translate(text: str, url: str, timeout: int) -> Optional[str]:
-    payload = {"text": text, "target": TARGET_LANG}
+async def _external_translate(svc: "_ExternalBackend", text: str, target: str) -> Optional[str]:
+    payload = {"text": text, "target": target}
     try:
-        resp = requests.post(url, json=payload, timeout=timeout)
+        resp = await _engine.client(svc.name).post(svc.url, json=payload, timeout=svc.timeout)
         resp.raise_for_status()
         try:
             data = resp.json()
@@ -175,33 +760,437 @@ def _external_translate(text: str, url: str, timeout: int) -> Optional[str]:
             return resp.text.strip()
         except Exception:
             return resp.text.strip()
-    except Exception:
+    except httpx.HTTPStatusError as e:
+        _honor_retry_after(svc.name, e.response)
+        return None
+    except httpx.HTTPError:
         return None
 
 
-def translate_text(text: str, system_prompt: Optional[str] = None) -> str:
-    services = globals().get("_services", [])
+# Built-in backends, registered in the order they are tried until measured
+# latency says otherwise.
+
+
+@backends.register("local")
+class _LocalBackend(backends.Backend):
+    # first in line: a hit costs microseconds and needs no network
+    timeout = 1
+    concurrency = 1
+    batch = True
+    batch_size = 32
+    batch_wait_ms = 2
+    # a line the phrase table does not cover is a miss, not a failure
+    misses = True
+
+    def __init__(self, cfg: dict):
+        super().__init__(cfg)
+        self.directory = cfg.get("phrases") or None
+        self._tables = {}
+
+    def _table(self, target: str) -> phrasebook.PhraseTable:
+        lang = detect.lang_code(target)
+        table = self._tables.get(lang)
+        if table is None:
+            table = self._tables[lang] = phrasebook.for_language(lang, self.directory)
+        return table
+
+    def supports(self, lang: str) -> bool:
+        return os.path.exists(self._table(lang).path)
+
+    def translate(self, text: str, target: str) -> Optional[str]:
+        return self._table(target).translate(text)
+
+    def translate_batch(self, texts: list, target: str) -> list:
+        return self._table(target).translate_batch(texts)
+
+
+@backends.register("google")
+class _GoogleBackend(backends.Backend):
+    async def translate(self, text: str, target: str) -> Optional[str]:
+        return await _engine.google(text, target)
+
+
+@backends.register("openai")
+class _OpenAIBackend(backends.Backend):
+    timeout = 8
+
+    def __init__(self, cfg: dict):
+        super().__init__(cfg)
+        self.api_url = cfg.get("api_url")
+        self.api_key = cfg.get("api_key")
+        self.model = cfg.get("model", "gpt-4.1-nano")
+        self.batch = bool((cfg.get("batch") or {}).get("enable"))
+        self.stream = bool(cfg.get("stream"))
+
+    async def translate(self, text: str, target: str) -> Optional[str]:
+        return await _openai_translate(self, text, target)
+
+    def translate_stream(self, text: str, target: str):
+        return _openai_stream(self, text, target)
+
+    async def translate_batch(self, texts: list, target: str) -> Optional[list]:
+        return await _openai_translate_batch(self, texts, target)
+
+
+@backends.register("external")
+class _ExternalBackend(backends.Backend):
+    timeout = 6
+
+    def __init__(self, cfg: dict):
+        super().__init__(cfg)
+        self.url = cfg["url"]
+
+    async def translate(self, text: str, target: str) -> Optional[str]:
+        return await _external_translate(self, text, target)
+
+
+async def _stream_backend(svc: backends.Backend, text: str, on_partial) -> Optional[str]:
+    async with _engine.limit(svc.name):
+        start = time.monotonic()
+        partial = None
+        async for partial in svc.translate_stream(text, TARGET_LANG):
+            if start is not None:
+                metrics.observe("first_partial", time.monotonic() - start, backend=svc.name)
+                start = None
+            on_partial(partial)
+        return partial
+
+
+async def _call_backend(svc: backends.Backend, text: str, on_partial=None) -> Optional[str]:
+    batcher = _engine.batchers.get(svc.name)
+    # stream when someone is showing partial results, unless a burst is
+    # better served by a batch request
+    if svc.stream and on_partial is not None and not (batcher is not None and _bursting()):
+        return await _stream_backend(svc, text, on_partial)
+    if batcher is not None:
+        return await batcher.translate(text)
+    async with _engine.limit(svc.name):
+        return await _run(svc.translate, text, TARGET_LANG)
+
+
+def _record_latency(name: str, elapsed: float):
+    samples = _latency.get(name)
+    if samples is None:
+        samples = _latency[name] = deque(maxlen=256)
+    samples.append(elapsed)
+
+
+def _hedge_delay(name: str) -> float:
+    samples = _latency.get(name)
+    if not samples or len(samples) < _hedge.get("min_samples", 20):
+        return _hedge.get("default_delay_ms", 1000) / 1000.0
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, int(len(ordered) * _hedge.get("percentile", 90) / 100))
+    return max(ordered[idx], _hedge.get("min_delay_ms", 50) / 1000.0)
+
+
+async def _attempt(
+    svc: backends.Backend, text: str, deadline: float, on_partial=None
+) -> Optional[str]:
+    name = svc.name
+    if _engine.bucket(name).blocked():
+        # still inside a Retry-After window, go straight to the next backend
+        _rate_stats[name]["skipped"] += 1
+        return None
+    health = _health[name]
+    if not health.allow():
+        return None
+    # Waiting for our own rate limit is not the backend being slow: the token
+    # is taken before the backend's timeout starts, and a wait that would
+    # outlast the line's deadline skips the backend instead of failing it.
+    try:
+        allowed = await _engine.throttle(name, deadline - time.monotonic())
+    except asyncio.CancelledError:
+        health.release()
+        raise
+    if not allowed:
+        health.release()
+        _rate_stats[name]["skipped"] += 1
+        return None
+    start = time.monotonic()
+    outcome = "ok"
+    try:
+        result = await asyncio.wait_for(_call_backend(svc, text, on_partial), svc.timeout)
+    except asyncio.TimeoutError:
+        print(f"translate timeout: {text}")
+        result = None
+        outcome = "timeout"
+    except asyncio.CancelledError:
+        health.release()
+        metrics.observe("backend", time.monotonic() - start, backend=name, outcome="cancelled")
+        raise
+    except Exception:
+        result = None
+    elapsed = time.monotonic() - start
+    if result:
+        _record_latency(name, elapsed)
+        health.success(elapsed)
+    elif outcome == "ok" and svc.misses:
+        health.release()
+        outcome = "miss"
+    else:
+        health.failure()
+        if outcome == "ok":
+            outcome = "error"
+    metrics.observe("backend", elapsed, backend=name, outcome=outcome)
+    return result
+
+
+def _bursting() -> bool:
+    return bool(_burst) and _active > _burst
+
+
+def _ordered_services(services: list) -> list:
+    now = time.monotonic()
+    # during a burst, backends that take a whole batch in one request go first
+    burst = _bursting()
+
+    def key(svc):
+        health = _health[svc.name]
+        return (
+            not health.available(now),
+            burst and not svc.batch,
+            health.expected_cost(now, svc.timeout),
+        )
+
+    return sorted(services, key=key)
+
+
+def _lost_hedge(losers, winner_started: float):
+    # A backend that was asked first and is still working when a later one
+    # answers is at least that slow; without a sample it would stay
+    # "unmeasured" and keep being tried first.
+    now = time.monotonic()
+    for svc, started in losers:
+        if started < winner_started:
+            _record_latency(svc.name, now - started)
+            _health[svc.name].lost(now - started)
+
+
+async def _translate_hedged(text: str, services: list, deadline: float, on_partial=None):
+    tasks = {}
+    next_idx = 0
+    primary = services[0]
+    try:
+        while True:
+            if not tasks:
+                if next_idx >= len(services):
+                    return None, None
+                svc = services[next_idx]
+                next_idx += 1
+                # only one backend at a time may stream into the overlay line
+                tasks[asyncio.ensure_future(_attempt(svc, text, deadline, on_partial))] = (
+                    svc,
+                    time.monotonic(),
+                )
+                delay = _hedge_delay(svc.name)
+            done, _ = await asyncio.wait(
+                tasks,
+                timeout=delay if next_idx < len(services) else None,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if not done:
+                svc = services[next_idx]
+                next_idx += 1
+                tasks[asyncio.ensure_future(_attempt(svc, text, deadline))] = (
+                    svc,
+                    time.monotonic(),
+                )
+                delay = _hedge_delay(svc.name)
+                _hedge_stats["hedges"] += 1
+                continue
+            for task in done:
+                svc, started = tasks.pop(task)
+                result = task.result()
+                if result:
+                    if tasks:
+                        _hedge_stats["cancelled"] += len(tasks)
+                        _lost_hedge(tasks.values(), started)
+                    if svc is not primary:
+                        _hedge_stats["wins"] += 1
+                    return svc.name, result
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def translate_async(text: str, on_partial=None) -> str:
+    global _active
+    deadline = time.monotonic() + TRANSLATION_TIMEOUT
+    if profiling.active:
+        profiling.checkpoint()
+    services = _services
+    original, replacements = text, []
+    if _glossary is not None:
+        text, replacements = _glossary.protect(text)
+        if replacements:
+            _glossary_stats["protected"] += 1
+            _glossary_stats["terms"] += len(replacements)
+            if glossary.only_terms(text):
+                _glossary_stats["answered_locally"] += 1
+                return glossary.restore(text, replacements)
     if not services:
+        return original
+    if _cache is not None:
+        names = [svc.name for svc in services]
+        hit = _cache.get_any(text, TARGET_LANG, names, disk=False)
+        if hit is None and _cache.io is not None:
+            hit = await asyncio.get_running_loop().run_in_executor(
+                _cache.io, _cache.get_any, text, TARGET_LANG, names
+            )
+        if hit:
+            return glossary.restore(hit, replacements)
+    partial = None
+    if on_partial is not None:
+
+        def partial(so_far: str):
+            on_partial(glossary.restore_partial(so_far, replacements))
+
+    _active += 1
+    try:
+        services = _ordered_services(services)
+        if _hedge.get("enable"):
+            name, result = await _translate_hedged(text, services, deadline, partial)
+        else:
+            name, result = None, None
+            for svc in services:
+                result = await _attempt(svc, text, deadline, partial)
+                if result:
+                    name = svc.name
+                    break
+    finally:
+        _active -= 1
+    if result:
+        if _cache is not None:
+            _cache.put(text, TARGET_LANG, name, result)
+        return glossary.restore(result, replacements)
+    return original
+
+
+async def _translate_with_deadline(text: str, on_partial=None) -> str:
+    try:
+        return await asyncio.wait_for(translate_async(text, on_partial), TRANSLATION_TIMEOUT)
+    except asyncio.TimeoutError:
         return text
-    for svc in services:
-        name = svc.get("name")
-        timeout = svc.get("timeout", 5)
+
+
+def _passthrough(text: str) -> bool:
+    if not _detect:
+        return False
+    _skip_stats["checked"] += 1
+    reason = detect.skip_reason(text, TARGET_LANG)
+    if reason is None:
+        return False
+    _skip_stats[reason] += 1
+    return True
+
+
+def local_answer(text: str) -> Optional[str]:
+    # The cheap checks that need no backend: lines already in TARGET_LANG or
+    # without letters pass through, lines made only of glossary terms are
+    # answered from the glossary. None means the line has to be translated.
+    if _engine is None:
+        return None
+    if _passthrough(text):
+        return text
+    if _glossary is not None:
+        protected, replacements = _glossary.protect(text)
+        if replacements and glossary.only_terms(protected):
+            _glossary_stats["protected"] += 1
+            _glossary_stats["terms"] += len(replacements)
+            _glossary_stats["answered_locally"] += 1
+            return glossary.restore(protected, replacements)
+    return None
+
+
+class _Flight:
+    __slots__ = ("future", "waiters", "listeners")
+
+    def __init__(self):
+        self.future = None
+        self.waiters = 0
+        self.listeners = []
+
+    def partial(self, so_far: str):
+        # runs on the engine thread with the streamed translation so far
+        for fn in list(self.listeners):
+            try:
+                fn(so_far)
+            except Exception:
+                traceback.print_exc()
+
+
+def _landed(key, future: Future):
+    with _inflight_lock:
+        flight = _inflight.get(key)
+        if flight is not None and flight.future is future:
+            del _inflight[key]
+
+
+def _follow(flight: _Flight) -> Future:
+    # Every caller gets its own future so that giving up on one message (the
+    # printer cancels expired ones) only cancels the backend call once nobody
+    # else is waiting on it.
+    waiter = Future()
+
+    def on_shared(shared: Future):
         try:
-            if name == "google":
-                future = _executor.submit(_google_translate, text, timeout)
-            elif name == "openai":
-                future = _executor.submit(_openai_translate, text, timeout)
-            elif name == "external":
-                url = svc.get("url")
-                future = _executor.submit(_external_translate, text, url, timeout)
+            if shared.cancelled():
+                waiter.cancel()
+            elif shared.exception() is not None:
+                waiter.set_exception(shared.exception())
             else:
-                continue
-            result = future.result(timeout=timeout + 1)
-            if result:
-                return result
-        except TimeoutError:
-            print(f"translate timeout: {text}")
-            continue
-        except Exception:
-            continue
-    return text
+                waiter.set_result(shared.result())
+        except InvalidStateError:
+            pass
+
+    def on_waiter(f: Future):
+        if not f.cancelled():
+            return
+        with _inflight_lock:
+            flight.waiters -= 1
+            idle = flight.waiters == 0
+        if idle:
+            flight.future.cancel()
+
+    waiter.add_done_callback(on_waiter)
+    flight.future.add_done_callback(on_shared)
+    return waiter
+
+
+def submit(
+    text: str, on_partial: Optional[Callable[[str], None]] = None, checked: bool = False
+) -> Future:
+    # on_partial, if given, is called from the engine thread with partial
+    # translations while a streaming backend is answering; checked means the
+    # caller already ran local_answer on the line
+    answer = None if checked else local_answer(text)
+    if _engine is None or answer is not None:
+        future = Future()
+        future.set_result(text if answer is None else answer)
+        return future
+    key = (normalize(text), TARGET_LANG)
+    with _inflight_lock:
+        flight = _inflight.get(key)
+        if flight is None or flight.future.done():
+            flight = _inflight[key] = _Flight()
+            if on_partial is not None:
+                flight.listeners.append(on_partial)
+            flight.future = _engine.submit(
+                _translate_with_deadline(text, flight.partial if on_partial else None)
+            )
+            _flight_stats["calls"] += 1
+            started = True
+        else:
+            if on_partial is not None:
+                flight.listeners.append(on_partial)
+            _flight_stats["coalesced"] += 1
+            started = False
+        flight.waiters += 1
+    if started:
+        flight.future.add_done_callback(lambda f: _landed(key, f))
+    return _follow(flight)
+
+
+def translate_text(text: str, system_prompt: Optional[str] = None) -> str:
+    return submit(text).result()
@@ -8,13 +8,17 @@ from PyQt5.QtWidgets import (
     QToolTip,
 )
 from PyQt5.QtCore import Qt, QTimer, pyqtSignal, QObject, QRect
+from PyQt5.QtGui import QColor, QTextCharFormat, QTextCursor
 import sys
 import threading
+from collections import deque
 
 _app = None
 _win = None
-_pending_texts = []
+_queue = deque()
+_flush_scheduled = False
 _pending_clear = False
+hotkeys = {}
 
 _initial_opacity = 0.95
 _min_opacity = 0.25
@@ -26,9 +30,21 @@ _resize_margin = 8
 _min_width = 200
 _min_height = 80
 
+_max_lines = 500
+_flush_interval_ms = 33
+
+_pending_color = QColor(255, 255, 255, 130)
+_failed_color = QColor(255, 190, 120)
+_state_marks = {
+    "partial": " …",
+    "timeout": " (timed out)",
+    "failed": " (failed)",
+    "dropped": " (dropped)",
+}
+
 
 class _TextSignal(QObject):
-    sig = pyqtSignal(str)
+    flush_sig = pyqtSignal()
     clear_sig = pyqtSignal()
 
 
@@ -77,10 +93,23 @@ class FloatingWindow(QWidget):
         self._idle_timer.timeout.connect(self._start_fade)
         self._idle_timer.start(_idle_delay_ms)
 
+        self._flush_timer = QTimer(self)
+        self._flush_timer.setSingleShot(True)
+        self._flush_timer.setInterval(_flush_interval_ms)
+        self._flush_timer.timeout.connect(self._flush)
+
+        self._blocks = {}
+        self._formats = {"pending": QTextCharFormat(), "failed": QTextCharFormat()}
+        self._formats["pending"].setForeground(_pending_color)
+        self._formats["failed"].setForeground(_failed_color)
+        self._formats["timeout"] = self._formats["failed"]
+        self._formats["dropped"] = self._formats["failed"]
+        self._plain = QTextCharFormat()
+
         self.setMouseTracking(True)
         self._init_ui()
 
-        _signal.sig.connect(self.receive_text)
+        _signal.flush_sig.connect(self._schedule_flush)
         _signal.clear_sig.connect(self.clear)
 
     def _init_ui(self):
@@ -97,6 +126,7 @@ class FloatingWindow(QWidget):
         self.text = QTextEdit(self)
         self.text.setReadOnly(True)
         self.text.setAcceptRichText(False)
+        self.text.document().setMaximumBlockCount(_max_lines)
         self.text.setVerticalScrollBarPolicy(Qt.ScrollBarAsNeeded)
         self.text.setHorizontalScrollBarPolicy(Qt.ScrollBarAsNeeded)
         self.text.installEventFilter(self)
@@ -143,6 +173,12 @@ class FloatingWindow(QWidget):
         ):
             self._reset_opacity_and_timer()
 
+        if event.type() == event.KeyPress and hotkeys:
+            for name, fn in hotkeys.items():
+                if event.key() == getattr(Qt, "Key_" + name, None):
+                    threading.Thread(target=fn, daemon=True).start()
+                    return True
+
         if event.type() in (
             event.MouseButtonPress,
             event.MouseButtonRelease,
@@ -238,18 +274,57 @@ class FloatingWindow(QWidget):
     def _drag_mouse_release(self, e):
         self._drag_offset = None
 
-    def receive_text(self, s):
+    def _schedule_flush(self):
+        if not self._flush_timer.isActive():
+            self._flush_timer.start()
+
+    def _flush(self):
+        global _flush_scheduled
+        _flush_scheduled = False
+        ops = []
+        while _queue:
+            ops.append(_queue.popleft())
+        if not ops:
+            return
         self._reset_opacity_and_timer()
-        if self.text.toPlainText():
-            self.text.append(s)
-        else:
-            self.text.setPlainText(s)
-        c = self.text.textCursor()
-        c.movePosition(c.End)
-        self.text.setTextCursor(c)
+        c = QTextCursor(self.text.document())
+        c.beginEditBlock()
+        for op, msg_id, s, state in ops:
+            if op == "add":
+                self._append(c, s, msg_id, state)
+            else:
+                self._replace(c, msg_id, s, state)
+        c.endEditBlock()
+        bar = self.text.verticalScrollBar()
+        bar.setValue(bar.maximum())
+
+    def _append(self, c, s, msg_id=None, state=None):
+        c.movePosition(QTextCursor.End)
+        if not self.text.document().isEmpty():
+            c.insertBlock()
+        c.insertText(s, self._formats.get(state, self._plain))
+        if msg_id is not None:
+            block = c.block()
+            block.setUserState(msg_id & 0x7FFFFFFF)
+            self._blocks[msg_id] = block
+
+    def _replace(self, c, msg_id, s, state):
+        block = self._blocks.pop(msg_id, None)
+        # the line may have been trimmed off the top or cleared in the meantime
+        if block is None or not block.isValid():
+            return
+        if block.userState() != msg_id & 0x7FFFFFFF:
+            return
+        if state in ("pending", "partial"):
+            self._blocks[msg_id] = block
+        c.setPosition(block.position())
+        c.movePosition(QTextCursor.EndOfBlock, QTextCursor.KeepAnchor)
+        c.insertText(s + _state_marks.get(state, ""), self._formats.get(state, self._plain))
 
     def clear(self):
         self._reset_opacity_and_timer()
+        _queue.clear()
+        self._blocks.clear()
         self.text.clear()
 
     def _reset_opacity_and_timer(self):
@@ -276,9 +351,8 @@ def _ensure_app_and_window():
     if _win is None:
         _win = FloatingWindow()
         _win.show()
-        for t in _pending_texts:
-            _signal.sig.emit(t)
-        _pending_texts.clear()
+        if _queue:
+            _signal.flush_sig.emit()
         if _pending_clear:
             _signal.clear_sig.emit()
             _pending_clear = False
@@ -289,12 +363,23 @@ def create_floating_window():
     _app.exec_()
 
 
-def send_text(s):
+def _post(op, msg_id, s, state):
+    global _flush_scheduled
+    _queue.append((op, msg_id, s, state))
     if _win is None:
-        _pending_texts.append(s)
         _ensure_app_and_window()
         return
-    _signal.sig.emit(s)
+    if not _flush_scheduled:
+        _flush_scheduled = True
+        _signal.flush_sig.emit()
+
+
+def send_text(s, msg_id=None):
+    _post("add", msg_id, s, None if msg_id is None else "pending")
+
+
+def update_text(msg_id, s, state="done"):
+    _post("set", msg_id, s, state)
 
 
 def clear_text():